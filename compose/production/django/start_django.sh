@@ -0,0 +1,4 @@
+#!/bin/sh
+
+python manage.py migrate
+exec gunicorn config.wsgi:application -c config/gunicorn.py
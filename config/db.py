@@ -0,0 +1,25 @@
+"""
+Health checks of persistent database connections (CONN_MAX_AGE).
+
+A connection that has been idle longer than DB_HEALTH_CHECK_INTERVAL seconds
+is pinged before the request uses it and is closed when the server has gone
+away, so Django reconnects instead of failing the request.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def close_unusable_connections(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        last_check = getattr(connection, 'health_checked_at', 0)
+        if now - last_check < settings.DB_HEALTH_CHECK_INTERVAL:
+            continue
+        if not connection.is_usable():
+            connection.close()
+        connection.health_checked_at = now
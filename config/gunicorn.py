@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration for production serving of config.wsgi.
+
+Every value can be overridden from the environment, see
+https://docs.gunicorn.org/en/20.0.4/settings.html
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+# application (and its warm-up in config.wsgi) is loaded once in the master and shared by forked workers
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+
+
+def post_fork(server, worker):
+    # database connections must never be shared between the master and forked workers
+    from django.db import connections
+    connections.close_all()
+
+
+def on_starting(server):
+    # quiz versions, ETags, throttling counters and replica pins live in the Django cache,
+    # a process-local cache would split them between workers
+    if server.cfg.workers < 2:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    from django.conf import settings
+    backend = settings.CACHES['default']['BACKEND']
+    if backend == 'django.core.cache.backends.locmem.LocMemCache':
+        raise RuntimeError(f'{server.cfg.workers} workers need a shared cache, set CACHE_URL (memcache://...)')
@@ -0,0 +1,146 @@
+"""
+Заранее сгенерированная OpenAPI схема.
+
+Схему генерирует команда generate_openapi_schema при сборке образа или прогрев процесса, если файла нет
+или он старше исходников проекта. Запросы только читают файл и его gzip копию, представления
+и сериализаторы при этом не анализируются.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.renderers import SwaggerUIRenderer
+
+
+class SchemaArtifact(NamedTuple):
+    content: bytes
+    compressed: bytes
+    etag: str
+
+
+_artifacts: Dict[str, SchemaArtifact] = {}
+
+_accept_encoding_re = re.compile(
+    r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*(0(?:\.\d{0,3})?|1(?:\.0{0,3})?))?\s*$', re.IGNORECASE
+)
+
+
+def generate_schema() -> bytes:
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    from config.urls import api_info
+
+    schema = OpenAPISchemaGenerator(api_info).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as artifact_file:
+        artifact_file.write(content)
+    os.replace(temporary, path)
+
+
+def write_schema(path: Optional[str] = None) -> SchemaArtifact:
+    """Генерирует схему и сохраняет ее вместе с gzip копией, gzip копия записывается первой"""
+    path = path or settings.OPENAPI_SCHEMA_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    content = generate_schema()
+    _write_atomic(f'{path}.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    _write_atomic(path, content)
+    _artifacts.pop(path, None)
+    return load_schema(path)
+
+
+def load_schema(path: Optional[str] = None) -> Optional[SchemaArtifact]:
+    """Сохраненная схема, читается с диска один раз за процесс"""
+    path = path or settings.OPENAPI_SCHEMA_PATH
+    artifact = _artifacts.get(path)
+    if artifact is None:
+        try:
+            with open(path, 'rb') as artifact_file:
+                content = artifact_file.read()
+            with open(f'{path}.gz', 'rb') as artifact_file:
+                compressed = artifact_file.read()
+        except FileNotFoundError:
+            return None
+        artifact = _artifacts[path] = SchemaArtifact(content, compressed, hashlib.sha1(content).hexdigest())
+    return artifact
+
+
+def is_stale(path: Optional[str] = None) -> bool:
+    """Файла схемы нет или он старше какого-либо python модуля проекта"""
+    path = path or settings.OPENAPI_SCHEMA_PATH
+    try:
+        generated_at = min(os.path.getmtime(path), os.path.getmtime(f'{path}.gz'))
+    except OSError:
+        return True
+    roots = {os.path.dirname(os.path.abspath(__file__))}
+    roots.update(app.path for app in apps.get_app_configs() if app.path.startswith(settings.BASE_DIR))
+    for root in roots:
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.py') and os.path.getmtime(os.path.join(directory, name)) > generated_at:
+                    return True
+    return False
+
+
+def ensure_schema() -> SchemaArtifact:
+    """Сохраненная схема, сначала генерируется, если ее нет или она устарела"""
+    if is_stale():
+        return write_schema()
+    return load_schema()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Клиент принимает gzip с ненулевым q-value, явно или через *"""
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        match = _accept_encoding_re.match(coding)
+        if match:
+            name, quality = match.groups()
+            qualities[name.lower()] = float(quality) if quality else 1.0
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0))) > 0
+
+
+def _serve_schema(request) -> HttpResponse:
+    artifact = load_schema()
+    if artifact is None:
+        raise Http404('OpenAPI schema is not generated, run manage.py generate_openapi_schema')
+
+    compressed = _accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    # у каждой кодировки свое представление и свой строгий ETag
+    etag = f'"{artifact.etag}-gzip"' if compressed else f'"{artifact.etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(artifact.compressed if compressed else artifact.content, content_type='application/json')
+        if compressed:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_safe
+def schema_view(request):
+    """Страница Swagger UI, а с ?format=openapi - сохраненная схема, которую она загружает"""
+    if request.GET.get('format') == 'openapi':
+        return _serve_schema(request)
+
+    from config.urls import api_info
+
+    renderer = SwaggerUIRenderer()
+    context = {'request': request}
+    renderer.set_context(context)
+    context['title'] = api_info.title
+    return HttpResponse(render_to_string(renderer.template, context, request))
@@ -1,20 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_auth.urls import LoginView, LogoutView
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from config.schema import schema_view
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Quizzes API",
-      default_version='v1',
-      description="Description",
-      contact=openapi.Contact(email="bobrov.v1ad3@gmail.com"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
+
+api_info = openapi.Info(
+   title="Quizzes API",
+   default_version='v1',
+   description="Description",
+   contact=openapi.Contact(email="bobrov.v1ad3@gmail.com"),
 )
 
 urlpatterns = [
@@ -24,5 +20,5 @@ urlpatterns = [
 
     path('api/v1/', include('quiz.urls')),
 
-    path('openapi/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('openapi/', schema_view, name='schema-swagger-ui'),
 ]
@@ -0,0 +1,20 @@
+"""
+Warm-up of a freshly started process before it accepts traffic.
+
+Imports the URLconf with every view and serializer and loads the precomputed
+OpenAPI schema, generating it only when the stored artifact is missing or stale,
+so the first requests do not pay for imports and DRF/drf-yasg introspection.
+"""
+
+from django.urls import get_resolver
+
+
+def warm_up():
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+
+    import quiz.serializers  # noqa: F401
+    from config.schema import ensure_schema
+
+    ensure_schema()
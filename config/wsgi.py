@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.core.signals import request_started
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from config.db import close_unusable_connections  # noqa: E402
+from config.warmup import warm_up  # noqa: E402
+
+request_started.connect(close_unusable_connections)
+warm_up()
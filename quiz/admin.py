@@ -1,13 +1,33 @@
 from django.contrib import admin
 
+from quiz.cache import QuizDefinitionCache
 from quiz.models import Quiz, Question, QuestionItem, Answer, User
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['user', 'question', 'text']
 
+
+@admin.register(QuestionItem)
+class QuestionItemAdmin(admin.ModelAdmin):
+    """Варианты ответа без приемников сигналов, кэш опроса сбрасывается после изменения"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        QuizDefinitionCache.invalidate(obj.question.quiz_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        QuizDefinitionCache.invalidate(obj.question.quiz_id)
+
+    def delete_queryset(self, request, queryset):
+        quiz_ids = set(queryset.values_list('question__quiz_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for quiz_id in quiz_ids:
+            QuizDefinitionCache.invalidate(quiz_id)
+
+
 # admin.site.register(Answer)
 admin.site.register(Quiz)
 admin.site.register(Question)
-admin.site.register(QuestionItem)
 admin.site.register(User)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class QuizConfig(AppConfig):
     name = 'quiz'
+
+    def ready(self):
+        # сброс кэша опросов при изменении через ORM, в том числе из админки
+        from . import signals  # noqa: F401
@@ -0,0 +1,274 @@
+import io
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, List, Tuple
+
+from django.contrib.auth.models import User as AdminUser
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .models import TYPE_ANSWER, Quiz, Question, QuestionItem, User
+from .renderers import FastJSONParser, FastJSONRenderer
+from .services import AnswerBulkCreateController
+
+QUESTION_TYPES = [question_type for question_type, _ in TYPE_ANSWER]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class QuizBenchmarkDataset:
+    """Генерация воспроизводимого набора данных для нагрузочного тестирования"""
+    prefix: str
+    random: random.Random
+    questions: List[Tuple[int, int, str, List[int]]]
+    quiz_ids: List[int]
+    users: List[str]
+
+    def __init__(self, prefix='bench', seed=0):
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.questions = []
+        self.quiz_ids = []
+        self.users = []
+
+    def _quiz_prefix(self) -> str:
+        return f'{self.prefix}-quiz-'
+
+    def clear(self) -> None:
+        """Удаление ранее созданного набора с тем же префиксом"""
+        Quiz.objects.filter(name__startswith=self._quiz_prefix()).delete()
+        User.objects.filter(name__startswith=f'{self.prefix}-').delete()
+
+    def seed(self, quizzes: int, questions: int, items: int, users: int, passes: int, batch_size=1000) -> None:
+        self.clear()
+        now = timezone.now()
+        Quiz.objects.bulk_create([Quiz(
+            name=f'{self._quiz_prefix()}{number}',
+            start_date=now - timedelta(days=1),
+            finish_date=now + timedelta(days=30),
+            description='benchmark'
+        ) for number in range(quizzes)], batch_size=batch_size)
+        quiz_ids = list(Quiz.objects.filter(name__startswith=self._quiz_prefix()).values_list('pk', flat=True))
+
+        Question.objects.bulk_create([Question(
+            quiz_id=quiz_id,
+            text=f'{self.prefix}-question-{number}',
+            type=QUESTION_TYPES[number % len(QUESTION_TYPES)]
+        ) for quiz_id in quiz_ids for number in range(questions)], batch_size=batch_size)
+        choice_questions = Question.objects.filter(quiz_id__in=quiz_ids).exclude(type='answer_text')
+        QuestionItem.objects.bulk_create([
+            QuestionItem(question_id=question_pk, name=f'{self.prefix}-item-{number}')
+            for question_pk in choice_questions.values_list('pk', flat=True) for number in range(items)
+        ], batch_size=batch_size)
+
+        self.load()
+        self.users = [f'{self.prefix}-user-{number}' for number in range(users)]
+        submissions = []
+        for user in self.users:
+            for quiz_id in self.random.sample(self.quiz_ids, min(passes, len(self.quiz_ids))):
+                submissions.append(self.submission(user, quiz_id))
+                if len(submissions) == batch_size:
+                    AnswerBulkCreateController(submissions).create()
+                    submissions = []
+        AnswerBulkCreateController(submissions).create()
+
+    def load(self) -> None:
+        """Загрузка структуры ранее созданных опросов набора"""
+        question_items = {}
+        rows = QuestionItem.objects.filter(
+            question__quiz__name__startswith=self._quiz_prefix()
+        ).values_list('question_id', 'pk')
+        for question_pk, item_pk in rows:
+            question_items.setdefault(question_pk, []).append(item_pk)
+        rows = Question.objects.filter(quiz__name__startswith=self._quiz_prefix()).order_by('pk').values_list(
+            'pk', 'quiz_id', 'type'
+        )
+        self.questions = [
+            (question_pk, quiz_id, question_type, question_items.get(question_pk, []))
+            for question_pk, quiz_id, question_type in rows
+        ]
+        self.quiz_ids = sorted({quiz_id for _, quiz_id, _, _ in self.questions})
+        if not self.users:
+            self.users = list(User.objects.filter(name__startswith=f'{self.prefix}-user-').values_list('name', flat=True))
+
+    def submission(self, user: str, quiz_id: int, rnd: random.Random = None) -> Dict:
+        rnd = rnd or self.random
+        questions = []
+        for question_pk, question_quiz_id, question_type, items in self.questions:
+            if question_quiz_id != quiz_id:
+                continue
+            if question_type == 'answer_text':
+                questions.append({'question': question_pk, 'text': 'benchmark', 'answer_selected': []})
+            elif question_type == 'answer_one_selected':
+                questions.append({'question': question_pk, 'text': None, 'answer_selected': [rnd.choice(items)]})
+            else:
+                selected = rnd.sample(items, rnd.randint(1, len(items)))
+                questions.append({'question': question_pk, 'text': None, 'answer_selected': selected})
+        return {'user': user, 'questions': questions}
+
+
+class QuizBenchmarkRunner:
+    """Прогон запросов к API в несколько потоков с замером задержек и количества SQL запросов"""
+    dataset: QuizBenchmarkDataset
+    concurrency: int
+    requests: int
+
+    def __init__(self, dataset, concurrency=4, requests=200):
+        self.dataset = dataset
+        self.concurrency = concurrency
+        self.requests = requests
+        admin, _ = AdminUser.objects.get_or_create(
+            username=f'{dataset.prefix}-admin', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        self.token = Token.objects.get_or_create(user=admin)[0].key
+
+    def scenarios(self) -> Dict[str, Callable[[Client, random.Random], object]]:
+        dataset = self.dataset
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token}'}
+        return {
+            'quizzes_pass': lambda client, rnd: client.post(
+                '/api/v1/quizzes/pass/',
+                json.dumps(dataset.submission(f'{dataset.prefix}-new-{rnd.random()}', rnd.choice(dataset.quiz_ids), rnd)),
+                content_type='application/json'
+            ),
+            'quizzes_users': lambda client, rnd: client.get(
+                f'/api/v1/quizzes/users/{rnd.choice(dataset.users)}/', HTTP_ACCEPT='application/json'
+            ),
+            'quizzes_all': lambda client, rnd: client.get('/api/v1/quizzes/all/', HTTP_ACCEPT='application/json'),
+            'question': lambda client, rnd: client.get(
+                f'/api/v1/quizzes/questions/{rnd.choice(dataset.questions)[0]}/', HTTP_ACCEPT='application/json', **auth
+            ),
+        }
+
+    def _worker(self, scenario: Callable, requests: int, seed: int) -> List[Tuple[float, int, int]]:
+        client = Client()
+        rnd = random.Random(seed)
+        samples = []
+        connection = connections['default']
+        try:
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = scenario(client, rnd)
+                    elapsed = time.perf_counter() - started
+                samples.append((elapsed, len(queries.captured_queries), response.status_code))
+        finally:
+            connection.close()
+        return samples
+
+    @staticmethod
+    def _latency_summary(samples: List[Tuple[float, int, int]]) -> Dict:
+        latencies = [elapsed * 1000 for elapsed, _, _ in samples]
+        return {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+        }
+
+    def run_scenario(self, name: str, scenario: Callable) -> Dict:
+        shares = [self.requests // self.concurrency + (1 if n < self.requests % self.concurrency else 0)
+                  for n in range(self.concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(self._worker, [scenario] * self.concurrency, shares, range(self.concurrency)))
+        wall = time.perf_counter() - started
+
+        samples = [sample for result in results for sample in result]
+        # задержки и запросы к базе считаются по успешным ответам, быстрые отказы не занижают перцентили
+        succeeded = [sample for sample in samples if 200 <= sample[2] < 300]
+        failed = [sample for sample in samples if not 200 <= sample[2] < 300]
+        queries = [count for _, count, _ in succeeded]
+        return {
+            'endpoint': name,
+            'requests': len(samples),
+            'concurrency': self.concurrency,
+            'errors': len(failed),
+            'rps': round(len(samples) / wall, 2) if wall else 0,
+            'latency_ms': self._latency_summary(succeeded),
+            'error_latency_ms': self._latency_summary(failed),
+            'queries_per_request': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else 0,
+                'max': max(queries, default=0),
+            },
+        }
+
+    def run(self, only=None) -> List[Dict]:
+        # все запросы идут с одного адреса, ограничение частоты клиента отключается;
+        # сброс нагрузки тоже отключается, иначе замеряется скорость отказов, а не endpoint'а
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+            QUIZ_SHED_MAX_CONCURRENCY=float('inf'),
+            QUIZ_SHED_DB_LATENCY_MS=float('inf'),
+        ):
+            return [
+                self.run_scenario(name, scenario) for name, scenario in self.scenarios().items()
+                if not only or name in only
+            ]
+
+
+class QuizSerializationBenchmark:
+    """Замер времени рендеринга и разбора JSON на телах запросов и ответах API для стандартной и быстрой пары"""
+    CODECS = {
+        'json': (JSONRenderer, JSONParser),
+        'fast': (FastJSONRenderer, FastJSONParser),
+    }
+    dataset: QuizBenchmarkDataset
+    repeat: int
+
+    def __init__(self, dataset, repeat=50):
+        self.dataset = dataset
+        self.repeat = repeat
+
+    def payloads(self) -> Dict[str, object]:
+        dataset = self.dataset
+        client = Client()
+        return {
+            'quizzes_pass': {
+                'user': f'{dataset.prefix}-serialization',
+                'questions': [
+                    question for quiz_id in dataset.quiz_ids
+                    for question in dataset.submission('', quiz_id)['questions']
+                ],
+            },
+            'quizzes_users': client.get(
+                f'/api/v1/quizzes/users/{dataset.users[0]}/', HTTP_ACCEPT='application/json'
+            ).data,
+            'quizzes_all': client.get('/api/v1/quizzes/all/', HTTP_ACCEPT='application/json').data,
+        }
+
+    def _measure(self, function: Callable) -> float:
+        started = time.perf_counter()
+        for _ in range(self.repeat):
+            function()
+        return round((time.perf_counter() - started) * 1000 / self.repeat, 3)
+
+    def run(self) -> List[Dict]:
+        results = []
+        for name, payload in self.payloads().items():
+            body = JSONRenderer().render(payload)
+            result = {'endpoint': name, 'bytes': len(body)}
+            for codec, (renderer_class, parser_class) in self.CODECS.items():
+                renderer, parser = renderer_class(), parser_class()
+                result[codec] = {
+                    'render_ms': self._measure(lambda: renderer.render(payload)),
+                    'parse_ms': self._measure(lambda: parser.parse(io.BytesIO(body))),
+                }
+            results.append(result)
+        return results
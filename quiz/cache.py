@@ -0,0 +1,183 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, Optional
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Func, QuerySet, TextField
+from django.db.models.functions import Cast
+
+from .models import Quiz, Question, QuestionItem
+
+
+class LRUCache:
+    """Потокобезопасный LRU кэш процесса с ограничением количества элементов и необязательным временем жизни"""
+    maxsize: int
+    ttl: Optional[float]
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class QuizDefinitionCache:
+    """
+    Кэш полного дерева опроса Quiz -> Question -> QuestionItem.
+
+    Дерево хранится под ключом (pk опроса, версия). Версия лежит в общем кэше Django
+    и увеличивается при каждом изменении опроса, поэтому устаревшие записи
+    обоих уровней кэша просто перестают читаться.
+    """
+    local = LRUCache(settings.QUIZ_DEFINITION_CACHE_SIZE)
+    # общая версия всех опросов для списков опросов
+    LIST_VERSION_KEY = 'quiz:list:version'
+
+    @staticmethod
+    def _version_key(quiz_id: int) -> str:
+        return f'quiz:{quiz_id}:version'
+
+    @staticmethod
+    def _definition_key(quiz_id: int, version: int) -> str:
+        return f'quiz:{quiz_id}:definition:{version}'
+
+    @staticmethod
+    def _get_or_init_version(key: str) -> int:
+        version = cache.get(key)
+        if version is None:
+            # начальная версия от времени, чтобы после вытеснения ключа не совпасть со старыми записями
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def _incr_version(key: str) -> None:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    @classmethod
+    def get_version(cls, quiz_id: int) -> int:
+        return cls._get_or_init_version(cls._version_key(quiz_id))
+
+    @classmethod
+    def get_list_version(cls) -> int:
+        return cls._get_or_init_version(cls.LIST_VERSION_KEY)
+
+    @classmethod
+    def bump_version(cls, quiz_id: int) -> None:
+        cls._incr_version(cls._version_key(quiz_id))
+        cls._incr_version(cls.LIST_VERSION_KEY)
+
+    @classmethod
+    def question_etag(cls, quiz_id: int, question_id: int) -> str:
+        """Строгий ETag вопроса, меняющийся при любом изменении его опроса"""
+        return f'"question-{question_id}-{cls.get_version(quiz_id)}"'
+
+    @classmethod
+    def list_etag(cls, queryset: QuerySet) -> str:
+        """
+        Строгий ETag списка опросов: md5 упорядоченного списка pk выборки одним запросом и общая версия опросов.
+
+        Изменения опросов меняют версию, а вход и выход опросов из выборки со временем - хэш состава.
+        """
+        digest = queryset.order_by().aggregate(digest=Func(
+            StringAgg(Cast('pk', TextField()), ',', ordering='pk'), function='MD5', output_field=TextField()
+        ))['digest']
+        return f'"quizzes-{digest}-{cls.get_list_version()}"'
+
+    @classmethod
+    def invalidate(cls, quiz_id: int) -> None:
+        """Увеличение версии опроса после фиксации текущей транзакции, вызывается сигналами моделей из quiz.signals"""
+        transaction.on_commit(lambda: cls.bump_version(quiz_id))
+
+    @staticmethod
+    def build(quiz_id: int) -> Optional[Dict]:
+        """
+        Материализация дерева опроса тремя запросами.
+
+        Дерево читается с основной базы: построенное по отстающей реплике, оно попало бы в кэш под новой версией.
+        """
+        quiz = Quiz.objects.using(DEFAULT_DB_ALIAS).filter(pk=quiz_id).values(
+            'pk', 'name', 'start_date', 'finish_date', 'description'
+        ).first()
+        if quiz is None:
+            return None
+
+        question_items = {}
+        rows = QuestionItem.objects.using(DEFAULT_DB_ALIAS).filter(question__quiz_id=quiz_id).order_by('pk').values_list(
+            'question_id', 'pk', 'name'
+        )
+        for question_pk, item_pk, name in rows:
+            question_items.setdefault(question_pk, []).append({'pk': item_pk, 'name': name})
+
+        rows = Question.objects.using(DEFAULT_DB_ALIAS).filter(quiz_id=quiz_id).order_by('pk').values_list('pk', 'text', 'type')
+        quiz['questions'] = [{
+            'pk': question_pk,
+            'text': text,
+            'type': question_type,
+            'question_item': question_items.get(question_pk, [])
+        } for question_pk, text, question_type in rows]
+        return quiz
+
+    @classmethod
+    def get(cls, quiz_id: int) -> Optional[Dict]:
+        """Дерево опроса; возвращаемые данные общие для всех читателей и не должны изменяться"""
+        version = cls.get_version(quiz_id)
+        local_key = (quiz_id, version)
+        definition = cls.local.get(local_key)
+        if definition is not None:
+            return definition
+
+        key = cls._definition_key(quiz_id, version)
+        definition = cache.get(key)
+        if definition is None:
+            definition = cls.build(quiz_id)
+            if definition is None:
+                return None
+            cache.set(key, definition, timeout=settings.QUIZ_DEFINITION_CACHE_TIMEOUT)
+        cls.local.set(local_key, definition)
+        return definition
+
+    @classmethod
+    def get_question(cls, quiz_id: int, question_id: int) -> Optional[Dict]:
+        definition = cls.get(quiz_id)
+        if definition is None:
+            return None
+        for question in definition['questions']:
+            if question['pk'] == question_id:
+                return question
+        return None
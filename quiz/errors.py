@@ -17,16 +17,40 @@ ERRORS = {
     'error_question_answer_items_not_belong_to_question': {
         'error_question_answer_items_not_belong_to_question': 'answer_selected is not belong to question!'
     },
+    'error_question_item_not_belong_to_question': {
+        'error_question_item_not_belong_to_question': 'question_item is not belong to question!'
+    },
+    'error_question_item_is_not_valid': {
+        'error_question_item_is_not_valid': 'question_item must be a name or an object with pk and name!'
+    },
     'error_change_start_date': {
         'error_change_start_date': 'You cannot change start_date field!'
     },
+    'error_question_is_not_exist': {
+        'error_question_is_not_exist': 'Question is not exist!'
+    },
     'error_quiz_is_not_exist': {
         'error_quiz_is_not_exist': 'Quiz is not exist!'
     },
     'error_type_question_is_not_exist': {
         'error_type_question_is_not_exist': 'Type of question is not exist!'
     },
+    'error_export_format_is_not_exist': {
+        'error_export_format_is_not_exist': 'Export format is not exist!'
+    },
     'error_user_does_not_exist': {
         'error_user_does_not_exist': 'This user does not exist!'
+    },
+    'error_question_key_is_not_unique': {
+        'error_question_key_is_not_unique': 'Question keys must be unique within quiz!'
+    },
+    'error_question_is_not_choice': {
+        'error_question_is_not_choice': 'Question must be answered by selecting question items!'
+    },
+    'error_quiz_key_is_not_unique': {
+        'error_quiz_key_is_not_unique': 'Quiz key is already imported from another record!'
+    },
+    'error_service_overloaded': {
+        'error_service_overloaded': 'Service is overloaded, retry later!'
     }
-}
\ No newline at end of file
+}
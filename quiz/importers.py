@@ -0,0 +1,237 @@
+import json
+import os
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Set
+
+import yaml
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import QuizDefinitionCache
+from .errors import ERRORS
+from .models import Quiz, Question, QuestionItem
+from .serializers import QuizImportSerializer
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _read_json_array(json_file, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Поэлементное чтение JSON массива без загрузки всего файла в память"""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    expect = '['
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of JSON array')
+            buffer, position = json_file.read(chunk_size), 0
+            eof = not buffer
+            continue
+
+        char = buffer[position]
+        if expect == '[':
+            if char != '[':
+                raise ValueError('JSON file must contain an array of quizzes')
+            position += 1
+            expect = 'value'
+        elif char == ']':
+            return
+        elif expect == ',':
+            if char != ',':
+                raise ValueError(f'Expected "," in JSON array, got {char!r}')
+            position += 1
+            expect = 'value'
+        else:
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                # объект не поместился в буфер: дочитываем не меньше текущего размера буфера
+                chunk = json_file.read(max(chunk_size, len(buffer) - position))
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield value
+            expect = ','
+            if position >= chunk_size:
+                buffer, position = buffer[position:], 0
+
+
+def read_quiz_definitions(path: str) -> Iterator[Dict]:
+    """
+    Потоковое чтение описаний опросов из файла.
+
+    YAML: по опросу на документ (документы разделены ---), JSON: массив опросов,
+    NDJSON/JSONL: по опросу на строку.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8') as definition_file:
+        if extension in ('.yaml', '.yml'):
+            for document in yaml.load_all(definition_file, Loader=YAML_LOADER):
+                if isinstance(document, list):
+                    yield from document
+                elif document is not None:
+                    yield document
+        elif extension in ('.ndjson', '.jsonl'):
+            for line in definition_file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from _read_json_array(definition_file)
+        else:
+            raise ValueError(f'Unsupported quiz definition file: {path}')
+
+
+class QuizImportController:
+    """
+    Импорт опросов из файлов с обновлением по внешним ключам опросов и вопросов.
+
+    Опросы обрабатываются пачками: на пачку приходится постоянное число запросов
+    на чтение и bulk_create/bulk_update независимо от количества вопросов.
+    Варианты ответа сопоставляются по тексту внутри вопроса. Вопросы и варианты,
+    отсутствующие в файле, удаляются только с prune, иначе попадают в отчет как stale.
+    """
+    QUIZ_FIELDS = ['name', 'start_date', 'finish_date', 'description']
+    QUESTION_FIELDS = ['text', 'type']
+    dry_run: bool
+    prune: bool
+    batch_size: int
+    report: Counter
+
+    def __init__(self, dry_run=False, prune=False, batch_size=None):
+        self.dry_run = dry_run
+        self.prune = prune
+        self.batch_size = batch_size or settings.QUIZ_IMPORT_BATCH_SIZE
+        self.report = Counter()
+        self._keys = set()
+        self._changed = set()
+
+    def _validate(self, data, source: str) -> Dict:
+        serializer = QuizImportSerializer(data=data)
+        if not serializer.is_valid():
+            raise serializers.ValidationError({source: serializer.errors})
+        definition = serializer.validated_data
+        if definition['key'] in self._keys:
+            raise serializers.ValidationError({source: ERRORS['error_quiz_key_is_not_unique']})
+        self._keys.add(definition['key'])
+        return definition
+
+    def _import_quizzes(self, definitions: List[Dict]) -> List[Quiz]:
+        existing = Quiz.objects.in_bulk([definition['key'] for definition in definitions], field_name='external_id')
+        quizzes, created, updated = [], [], []
+        for definition in definitions:
+            quiz = existing.get(definition['key'])
+            if quiz is None:
+                quiz = Quiz(external_id=definition['key'], **{field: definition[field] for field in self.QUIZ_FIELDS})
+                created.append(quiz)
+            elif any(getattr(quiz, field) != definition[field] for field in self.QUIZ_FIELDS):
+                for field in self.QUIZ_FIELDS:
+                    setattr(quiz, field, definition[field])
+                updated.append(quiz)
+                self._changed.add(quiz.pk)
+            quizzes.append(quiz)
+
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        Quiz.objects.bulk_create(created, batch_size=batch_size)
+        Quiz.objects.bulk_update(updated, self.QUIZ_FIELDS, batch_size=batch_size)
+        self.report['quizzes_created'] += len(created)
+        self.report['quizzes_updated'] += len(updated)
+        self.report['quizzes_unchanged'] += len(quizzes) - len(created) - len(updated)
+        return quizzes
+
+    def _import_questions(self, quizzes: List[Quiz], definitions: List[Dict]) -> List[Question]:
+        existing, stale = {}, {}
+        for question in Question.objects.filter(quiz__in=quizzes):
+            stale[question.pk] = question
+            if question.external_id is not None:
+                existing[(question.quiz_id, question.external_id)] = question
+
+        questions, created, updated = [], [], []
+        for quiz, definition in zip(quizzes, definitions):
+            for question_data in definition['questions']:
+                question = existing.get((quiz.pk, question_data['key']))
+                if question is None:
+                    question = Question(quiz=quiz, external_id=question_data['key'], text=question_data['text'],
+                                        type=question_data['type'])
+                    created.append(question)
+                    self._changed.add(quiz.pk)
+                else:
+                    stale.pop(question.pk)
+                    if any(getattr(question, field) != question_data[field] for field in self.QUESTION_FIELDS):
+                        for field in self.QUESTION_FIELDS:
+                            setattr(question, field, question_data[field])
+                        updated.append(question)
+                        self._changed.add(quiz.pk)
+                questions.append(question)
+
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        Question.objects.bulk_create(created, batch_size=batch_size)
+        Question.objects.bulk_update(updated, self.QUESTION_FIELDS, batch_size=batch_size)
+        self.report['questions_created'] += len(created)
+        self.report['questions_updated'] += len(updated)
+        self.report['questions_unchanged'] += len(questions) - len(created) - len(updated)
+        self._drop_stale(Question, stale, 'questions', {question.quiz_id for question in stale.values()})
+        return questions
+
+    def _import_question_items(self, questions: List[Question], definitions: List[Dict]) -> None:
+        question_data = [data for definition in definitions for data in definition['questions']]
+        existing, stale, quiz_ids = {}, {}, {}
+        rows = QuestionItem.objects.filter(question__in=questions).values_list('pk', 'question_id', 'name')
+        for item_pk, question_pk, name in rows:
+            existing.setdefault(question_pk, {}).setdefault(name, item_pk)
+            stale[item_pk] = question_pk
+
+        created = []
+        for question, data in zip(questions, question_data):
+            question_items = existing.get(question.pk, {})
+            for name in dict.fromkeys(data.get('question_item') or []):
+                item_pk = question_items.get(name)
+                if item_pk is None:
+                    created.append(QuestionItem(question=question, name=name))
+                    self._changed.add(question.quiz_id)
+                else:
+                    stale.pop(item_pk)
+            quiz_ids[question.pk] = question.quiz_id
+
+        QuestionItem.objects.bulk_create(created, batch_size=settings.QUIZ_PASS_BULK_BATCH_SIZE)
+        self.report['question_items_created'] += len(created)
+        self._drop_stale(QuestionItem, stale, 'question_items', {quiz_ids[question_pk] for question_pk in stale.values()})
+
+    def _drop_stale(self, model, stale: Dict, name: str, quiz_ids: Set[int]) -> None:
+        if not stale:
+            return
+        if self.prune:
+            model.objects.filter(pk__in=list(stale)).delete()
+            self.report[f'{name}_deleted'] += len(stale)
+            self._changed.update(quiz_ids)
+        else:
+            self.report[f'{name}_stale'] += len(stale)
+
+    def _import_batch(self, definitions: List[Dict]) -> None:
+        quizzes = self._import_quizzes(definitions)
+        questions = self._import_questions(quizzes, definitions)
+        self._import_question_items(questions, definitions)
+
+    def run(self, paths: Iterable[str]) -> Counter:
+        with transaction.atomic():
+            batch = []
+            for path in paths:
+                for number, data in enumerate(read_quiz_definitions(path), 1):
+                    batch.append(self._validate(data, f'{path}:{number}'))
+                    if len(batch) == self.batch_size:
+                        self._import_batch(batch)
+                        batch = []
+            if batch:
+                self._import_batch(batch)
+
+            if self.dry_run:
+                transaction.set_rollback(True)
+            else:
+                # bulk_create/bulk_update не отправляют сигналы сохранения, версии опросов увеличиваются явно
+                for quiz_id in self._changed:
+                    QuizDefinitionCache.invalidate(quiz_id)
+        return self.report
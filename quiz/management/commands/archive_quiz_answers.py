@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quiz.services import check_quiz_is_exist, QuizAnswerArchiveController
+
+
+class Command(BaseCommand):
+    help = 'Перенос ответов завершенных опросов в архив и возврат из архива'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', help='pk опроса, можно указать несколько раз')
+        parser.add_argument('--older-than-days', type=int,
+                            help='Архивировать опросы, завершенные больше указанного количества дней назад')
+        parser.add_argument('--chunk-size', type=int, help='Количество pk пользователей, переносимых одной транзакцией')
+        parser.add_argument('--restore', action='store_true', help='Вернуть ответы опросов --quiz из архива')
+
+    def handle(self, *args, **options):
+        controller = QuizAnswerArchiveController(options['chunk_size'])
+        quiz_ids = options['quiz']
+        for quiz_id in quiz_ids or []:
+            if not check_quiz_is_exist(quiz_id):
+                raise CommandError(f'Quiz {quiz_id} is not exist!')
+
+        if options['restore']:
+            if not quiz_ids:
+                raise CommandError('--restore requires --quiz')
+            for quiz_id in quiz_ids:
+                self.stdout.write(f'Quiz {quiz_id}: restored {controller.restore(quiz_id)} answers')
+            return
+
+        if quiz_ids is None:
+            days = options['older_than_days']
+            finished_before = timezone.now() - timedelta(
+                days=settings.QUIZ_ARCHIVE_AFTER_DAYS if days is None else days
+            )
+            quiz_ids = controller.finished_quizzes(finished_before)
+        for quiz_id in quiz_ids:
+            self.stdout.write(f'Quiz {quiz_id}: archived answers of {controller.archive(quiz_id)} users')
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from quiz.benchmark import QuizBenchmarkDataset, QuizBenchmarkRunner, QuizSerializationBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочное тестирование API опросов на локальной базе с выводом результатов в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Префикс имен создаваемых опросов и пользователей')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--skip-seed', action='store_true', help='Использовать ранее созданный набор данных')
+        parser.add_argument('--quizzes', type=int, default=10)
+        parser.add_argument('--questions', type=int, default=20, help='Вопросов в опросе')
+        parser.add_argument('--items', type=int, default=4, help='Вариантов ответа в вопросе с выбором')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--passes', type=int, default=5, help='Пройденных опросов на пользователя')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый endpoint')
+        parser.add_argument('--endpoint', action='append', help='Запустить только указанные сценарии')
+        parser.add_argument(
+            '--serialization', action='store_true', help='Добавить замер рендеринга и разбора JSON на данных API'
+        )
+        parser.add_argument('--output', help='Путь к файлу результатов, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        dataset = QuizBenchmarkDataset(options['prefix'], options['seed'])
+        if options['skip_seed']:
+            dataset.load()
+        else:
+            dataset.seed(
+                options['quizzes'], options['questions'], options['items'], options['users'], options['passes']
+            )
+
+        runner = QuizBenchmarkRunner(dataset, options['concurrency'], options['requests'])
+        result = {
+            'dataset': {
+                'quizzes': len(dataset.quiz_ids),
+                'questions': len(dataset.questions),
+                'users': len(dataset.users),
+            },
+            'results': runner.run(options['endpoint']),
+        }
+        if options['serialization']:
+            result['serialization'] = QuizSerializationBenchmark(dataset).run()
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.serializers import QuizCrosstabSerializer
+from quiz.services import check_quiz_is_exist, QuizCrosstabController
+
+
+class Command(BaseCommand):
+    help = 'Таблица сопряженности выборов вариантов ответа двух вопросов опроса в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz', type=int, help='pk опроса')
+        parser.add_argument('question_a', type=int, help='pk вопроса по строкам таблицы')
+        parser.add_argument('question_b', type=int, help='pk вопроса по столбцам таблицы')
+        parser.add_argument('--block-size', type=int, help='Количество ячеек индикаторных матриц блока пользователей')
+        parser.add_argument('--output', help='Путь к файлу, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        if not check_quiz_is_exist(options['quiz']):
+            raise CommandError(f"Quiz {options['quiz']} is not exist!")
+        serializer = QuizCrosstabSerializer(data=options, context={'quiz': options['quiz']})
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+
+        crosstab_controller = QuizCrosstabController(
+            options['quiz'], block_size=options['block_size'], **serializer.validated_data
+        )
+        crosstab = json.dumps(crosstab_controller.compute(), ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(crosstab)
+        else:
+            self.stdout.write(crosstab)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.services import check_quiz_is_exist, QuizAnswersExportController
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка всех ответов опроса в NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz', type=int, help='pk опроса')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--output', help='Путь к файлу, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, help='Количество строк, читаемых из базы за раз')
+
+    def handle(self, *args, **options):
+        if not check_quiz_is_exist(options['quiz']):
+            raise CommandError(f"Quiz {options['quiz']} is not exist!")
+
+        export = QuizAnswersExportController(options['quiz'], options['chunk_size'])
+        rows = export.to_csv() if options['format'] == 'csv' else export.to_ndjson()
+        if options['output']:
+            newline = '' if options['format'] == 'csv' else None
+            with open(options['output'], 'w', encoding='utf-8', newline=newline) as output:
+                output.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
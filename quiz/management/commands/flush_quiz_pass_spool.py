@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quiz.spool import SubmissionSpool
+
+
+class Command(BaseCommand):
+    help = 'Фоновая запись прохождений опросов из локального журнала в базу пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Записать накопленный журнал и завершиться')
+        parser.add_argument('--flush-size', type=int, default=settings.QUIZ_PASS_SPOOL_FLUSH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.QUIZ_PASS_SPOOL_FLUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+        spool = SubmissionSpool()
+        while True:
+            started = time.monotonic()
+            flushed = spool.flush(options['flush_size'])
+            if flushed or options['verbosity'] > 1:
+                lag = spool.lag()
+                self.stdout.write(
+                    f"flushed={flushed} pending_segments={lag['pending_segments']} "
+                    f"pending_bytes={lag['pending_bytes']} lag_seconds={lag['lag_seconds']}"
+                )
+            if options['once']:
+                break
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from config.schema import write_schema
+
+
+class Command(BaseCommand):
+    help = 'Генерация схемы OpenAPI и ее сжатой копии для выдачи по /openapi/ без построения на запросе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Путь к файлу схемы, по умолчанию OPENAPI_SCHEMA_PATH')
+
+    def handle(self, *args, **options):
+        artifact = write_schema(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'OpenAPI schema generated: {len(artifact.content)} bytes, {len(artifact.compressed)} gzipped'
+        ))
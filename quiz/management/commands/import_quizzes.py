@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from quiz.importers import QuizImportController
+
+
+class Command(BaseCommand):
+    help = 'Импорт опросов из YAML/JSON/NDJSON файлов с обновлением по внешним ключам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы с описаниями опросов')
+        parser.add_argument('--dry-run', action='store_true', help='Показать изменения без записи в базу')
+        parser.add_argument('--prune', action='store_true',
+                            help='Удалять вопросы и варианты ответа, отсутствующие в файле')
+        parser.add_argument('--batch-size', type=int, help='Количество опросов, обрабатываемых за один проход')
+
+    def handle(self, *args, **options):
+        controller = QuizImportController(options['dry_run'], options['prune'], options['batch_size'])
+        try:
+            report = controller.run(options['paths'])
+        except serializers.ValidationError as error:
+            raise CommandError(error.detail)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for name, count in sorted(report.items()):
+            self.stdout.write(f'{name}: {count}')
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: changes are rolled back'))
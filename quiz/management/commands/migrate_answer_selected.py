@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from quiz.services import AnswerSelectedStorageController
+
+
+class Command(BaseCommand):
+    help = 'Перенос выбранных вариантов ответа между таблицей связей и массивом Answer.selected_items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['inline', 'm2m'], required=True, help='Целевой способ хранения')
+        parser.add_argument('--batch-size', type=int, help='Количество pk ответов, переносимых одной транзакцией')
+        parser.add_argument('--keep-source', action='store_true', help='Не удалять данные из исходного хранилища')
+
+    def handle(self, *args, **options):
+        controller = AnswerSelectedStorageController(options['batch_size'])
+        if options['to'] == 'inline':
+            moved = controller.to_inline(options['keep_source'])
+            self.stdout.write(f'Answers moved to selected_items: {moved}')
+        else:
+            moved = controller.to_m2m(options['keep_source'])
+            self.stdout.write(f'Selected items moved to answer_selected: {moved}')
+        self.stdout.write(
+            f"Set QUIZ_ANSWER_SELECTED_STORAGE={options['to']} to read and write the new storage"
+        )
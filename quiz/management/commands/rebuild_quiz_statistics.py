@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.services import check_quiz_is_exist, QuizStatisticController
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков ответов на вопросы с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, help='pk опроса, по умолчанию пересчитываются все опросы')
+
+    def handle(self, *args, **options):
+        if options['quiz'] is not None and not check_quiz_is_exist(options['quiz']):
+            raise CommandError(f"Quiz {options['quiz']} is not exist!")
+
+        QuizStatisticController.rebuild(options['quiz'])
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt'))
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.10 on 2026-10-18 14:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_auto_20200802_2307'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers_count', models.PositiveIntegerField(default=0, verbose_name='Количество ответов')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistic', to='quiz.Question', verbose_name='Вопрос')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionItemStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_count', models.PositiveIntegerField(default=0, verbose_name='Количество выборов')),
+                ('question_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistic', to='quiz.QuestionItem', verbose_name='Вариант ответа')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.10 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_questionitemstatistic_questionstatistic'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['finish_date', 'start_date'], name='quiz_active_window_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_auto_20261018_1449'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionSpoolCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=256, unique=True, verbose_name='Сегмент журнала')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Смещение')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_submissionspoolcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='external_id',
+            field=models.CharField(blank=True, editable=False, max_length=128, null=True, verbose_name='Внешний ключ'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='external_id',
+            field=models.CharField(blank=True, editable=False, max_length=128, null=True, unique=True, verbose_name='Внешний ключ'),
+        ),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('quiz', 'external_id'), name='question_quiz_external_id_uniq'),
+        ),
+    ]
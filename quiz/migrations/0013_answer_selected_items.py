@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_quiz_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='selected_items',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, null=True, size=None, verbose_name='Выбранные варианты ответа'),
+        ),
+    ]
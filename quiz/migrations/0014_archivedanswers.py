@@ -0,0 +1,29 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:28
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_answer_selected_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAnswers',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='Ответы')),
+                ('archived_at', models.DateTimeField(verbose_name='Дата архивации')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_answers', to='quiz.Quiz', verbose_name='Опрос')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.User', verbose_name='Пользователь')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='archivedanswers',
+            constraint=models.UniqueConstraint(fields=('quiz', 'user'), name='archived_answers_quiz_user_uniq'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0014_archivedanswers'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='quiz',
+            name='quiz_active_window_idx',
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['finish_date', 'start_date', 'id'], name='quiz_active_window_idx'),
+        ),
+    ]
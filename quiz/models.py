@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.db import models
 
 
@@ -14,6 +15,17 @@ class Quiz(models.Model):
     start_date = models.DateTimeField(verbose_name='Дата старта')
     finish_date = models.DateTimeField(verbose_name='Дата окончания')
     description = models.TextField(verbose_name='Описание')
+    external_id = models.CharField(
+        max_length=128, unique=True, null=True, blank=True, editable=False, verbose_name='Внешний ключ'
+    )
+
+    class Meta:
+        indexes = [
+            # finish_date первым: завершенные опросы отсекаются диапазоном по индексу,
+            # start_date проверяется по тому же индексу без чтения строк таблицы, а pk в индексе
+            # дает агрегаты ETag списка и pk страницы без обращения к таблице (index-only scan)
+            models.Index(fields=['finish_date', 'start_date', 'id'], name='quiz_active_window_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -24,6 +36,12 @@ class Question(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='questions', verbose_name='Опрос')
     text = models.TextField(verbose_name='Текст вопроса')
     type = models.CharField(choices=TYPE_ANSWER, max_length=256, verbose_name='Тип вопроса')
+    external_id = models.CharField(max_length=128, null=True, blank=True, editable=False, verbose_name='Внешний ключ')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'external_id'], name='question_quiz_external_id_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.quiz}|{self.text}"
@@ -54,6 +72,56 @@ class Answer(models.Model):
     answer_selected = models.ManyToManyField(
         QuestionItem, verbose_name='Ответы/Ответ на вопрос выбранные из списка ответов', blank=True
     )
+    # pk выбранных вариантов при QUIZ_ANSWER_SELECTED_STORAGE = 'inline' вместо строк в answer_selected
+    selected_items = ArrayField(
+        models.IntegerField(), null=True, blank=True, verbose_name='Выбранные варианты ответа'
+    )
+
+    def __str__(self):
+        return f"{self.question}| {self.text}"
+
+
+class QuestionStatistic(models.Model):
+    """Счетчик ответов на вопрос, обновляемый при сохранении прохождений опроса"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='statistic', verbose_name='Вопрос')
+    answers_count = models.PositiveIntegerField(default=0, verbose_name='Количество ответов')
+
+    def __str__(self):
+        return f"{self.question}| {self.answers_count}"
+
+
+class QuestionItemStatistic(models.Model):
+    """Счетчик выбора варианта ответа, обновляемый при сохранении прохождений опроса"""
+    question_item = models.OneToOneField(
+        QuestionItem, on_delete=models.CASCADE, related_name='statistic', verbose_name='Вариант ответа'
+    )
+    selected_count = models.PositiveIntegerField(default=0, verbose_name='Количество выборов')
+
+    def __str__(self):
+        return f"{self.question_item}| {self.selected_count}"
+
+
+class SubmissionSpoolCheckpoint(models.Model):
+    """Смещение уже записанной в базу части сегмента журнала прохождений опросов"""
+    segment = models.CharField(max_length=256, unique=True, verbose_name='Сегмент журнала')
+    offset = models.BigIntegerField(default=0, verbose_name='Смещение')
+
+    def __str__(self):
+        return f"{self.segment}| {self.offset}"
+
+
+class ArchivedAnswers(models.Model):
+    """Ответы пользователя на завершенный опрос, перенесенные из Answer в архив одной строкой"""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='archived_answers', verbose_name='Опрос')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    # [[pk ответа, pk вопроса, текст ответа, [pk выбранных вариантов]], ...] в порядке pk ответов
+    answers = JSONField(verbose_name='Ответы')
+    archived_at = models.DateTimeField(verbose_name='Дата архивации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'user'], name='archived_answers_quiz_user_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.question}| {self.text}"
\ No newline at end of file
+        return f"{self.quiz}| {self.user}"
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по ключу pk без COUNT(*) и OFFSET.
+
+    Страница выбирается условием pk > последнего pk предыдущей страницы,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    """
+    ordering = 'pk'
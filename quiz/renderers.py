@@ -0,0 +1,84 @@
+import datetime
+import decimal
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF поля форматируют даты по DATETIME_FORMAT/DATE_FORMAT/TIME_FORMAT с учетом часового пояса
+DATETIME_FIELD = serializers.DateTimeField()
+DATE_FIELD = serializers.DateField()
+TIME_FIELD = serializers.TimeField()
+
+
+def default(obj):
+    """Преобразование типов, которые orjson не сериализует сам, как в rest_framework.utils.encoders.JSONEncoder"""
+    if isinstance(obj, datetime.datetime):
+        return DATETIME_FIELD.to_representation(obj)
+    if isinstance(obj, datetime.date):
+        return DATE_FIELD.to_representation(obj)
+    if isinstance(obj, datetime.time):
+        return TIME_FIELD.to_representation(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__getitem__'):
+        try:
+            return dict(obj)
+        except (TypeError, ValueError):
+            pass
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON рендерер на orjson.
+
+    Даты и время форматируются по настройкам REST_FRAMEWORK, остальные типы как у JSONRenderer.
+    Отступ поддерживается только в 2 пробела. Без orjson работает как JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=default, option=option)
+        # \u2028 и \u2029 экранируются, чтобы ответ оставался подмножеством javascript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSON парсер на orjson, без orjson работает как JSONParser"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
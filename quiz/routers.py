@@ -0,0 +1,110 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+# реплика, выбранная для чтения в текущем запросе, None - чтение с основной базы
+_read_alias: ContextVar[Optional[str]] = ContextVar('quiz_read_alias', default=None)
+# отставание реплик по данным последней проверки процесса: alias -> (время проверки, отставание в секундах)
+_replica_lag: Dict[str, Tuple[float, float]] = {}
+
+REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def get_replica_lag(alias: str) -> float:
+    """Отставание реплики в секундах, не чаще раза в DATABASE_REPLICA_LAG_CHECK_INTERVAL; недоступная реплика отстает бесконечно"""
+    now = time.monotonic()
+    checked_at, lag = _replica_lag.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            lag = float('inf')
+        _replica_lag[alias] = (now, lag)
+    return lag
+
+
+def choose_replica() -> Optional[str]:
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if get_replica_lag(alias) <= settings.DATABASE_REPLICA_MAX_LAG
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def replica_reads():
+    """Чтение через ORM внутри блока с одной реплики, отставание которой не больше DATABASE_REPLICA_MAX_LAG"""
+    token = _read_alias.set(choose_replica() if settings.DATABASE_REPLICAS else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _pin_key(request) -> str:
+    return f'db:pin:{BaseThrottle().get_ident(request)}'
+
+
+def pin_to_primary(request) -> None:
+    cache.set(_pin_key(request), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request) -> bool:
+    return cache.get(_pin_key(request)) is not None
+
+
+class ReplicaRouter:
+    """
+    Маршрутизация чтения на реплики из DATABASE_REPLICAS.
+
+    На реплику идет только чтение внутри replica_reads(), запись и остальное чтение - на основную базу.
+    Миграции на реплики не применяются.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+class PrimaryPinMiddleware:
+    """Закрепление клиента за основной базой на DATABASE_REPLICA_PIN_SECONDS после изменяющего запроса"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            pin_to_primary(request)
+        return response
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы клиентов, не закрепленных за основной базой, читают с реплики"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS and not is_pinned(request):
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
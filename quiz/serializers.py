@@ -1,8 +1,12 @@
+from typing import Dict, Iterable, List, Tuple
+
+from django.db.models import QuerySet
 from rest_framework import serializers
 
-from .models import Quiz, Question, QuestionItem, TYPE_ANSWER, Answer, User
+from .models import Quiz, Question, QuestionItem, TYPE_ANSWER, User
 from .services import QuestionCreateController, QuestionUpdateController, AnswerCreateController, \
-    QuizUserResultController
+    AnswerBulkCreateController, QuizUserResultController, QuestionItemIndex, UserController, QuizTreeCreateController
+from .cache import QuizDefinitionCache
 from .errors import ERRORS
 
 
@@ -32,6 +36,36 @@ class QuizSerializer(serializers.ModelSerializer):
         return super(QuizSerializer, self).update(instance, validated_data)
 
 
+class QuizActiveFilterSerializer(serializers.Serializer):
+    """Параметры выборки активных опросов"""
+    as_of = serializers.DateTimeField(required=False)
+
+
+class QuizUserResultFilterSerializer(serializers.Serializer):
+    """Параметры выборки результатов пользователя"""
+    history = serializers.BooleanField(required=False, default=False)
+
+
+class QuizCrosstabSerializer(serializers.Serializer):
+    """Параметры таблицы сопряженности двух вопросов опроса, в context передается pk опроса"""
+    question_a = serializers.IntegerField()
+    question_b = serializers.IntegerField()
+
+    def _get_choice_question(self, question_id: int):
+        question = QuizDefinitionCache.get_question(self.context['quiz'], question_id)
+        if question is None:
+            raise serializers.ValidationError(ERRORS['error_question_is_not_exist'])
+        if question['type'] == 'answer_text':
+            raise serializers.ValidationError(ERRORS['error_question_is_not_choice'])
+        return question
+
+    def validate_question_a(self, value):
+        return self._get_choice_question(value)
+
+    def validate_question_b(self, value):
+        return self._get_choice_question(value)
+
+
 class QuestionCreateSerializer(serializers.Serializer, QuestionTypeValidationMixin):
     """Сериалайзер для модели Question"""
     quiz = serializers.IntegerField()
@@ -46,11 +80,32 @@ class QuestionCreateSerializer(serializers.Serializer, QuestionTypeValidationMix
         return question
 
 
+class QuestionItemReferenceSerializer(serializers.Serializer):
+    """Существующий вариант ответа вопроса, без name название не меняется"""
+    pk = serializers.IntegerField()
+    name = serializers.CharField(max_length=256, required=False)
+
+
+class QuestionItemUpdateField(serializers.Field):
+    """Вариант ответа в изменении вопроса: название или {'pk': ..., 'name': ...} существующего варианта"""
+    name_field = serializers.CharField(max_length=256)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            return self.name_field.run_validation(data)
+        if isinstance(data, dict):
+            return dict(QuestionItemReferenceSerializer().run_validation(data))
+        raise serializers.ValidationError(ERRORS['error_question_item_is_not_valid'])
+
+    def to_representation(self, value):
+        return value
+
+
 class QuestionUpdateSerializer(serializers.Serializer, QuestionTypeValidationMixin):
     quiz = QuizSerializer(required=False, read_only=True)
     text = serializers.CharField(required=False)
     type = serializers.ChoiceField(choices=TYPE_ANSWER, required=False)
-    question_item = serializers.ListField(required=False)
+    question_item = serializers.ListField(child=QuestionItemUpdateField(), required=False)
 
     def validate(self, attrs):
         return self.validation(attrs)
@@ -61,10 +116,56 @@ class QuestionUpdateSerializer(serializers.Serializer, QuestionTypeValidationMix
         return question
 
 
+class QuestionTreeSerializer(serializers.Serializer, QuestionTypeValidationMixin):
+    """Вопрос с вариантами ответа в составе создаваемого опроса"""
+    text = serializers.CharField()
+    type = serializers.ChoiceField(choices=TYPE_ANSWER)
+    question_item = serializers.ListField(child=serializers.CharField(max_length=256), required=False)
+
+    def validate(self, attrs):
+        return self.validation(attrs)
+
+
+class QuizTreeCreateSerializer(serializers.Serializer):
+    """Сериалайзер создания опроса вместе с вопросами и вариантами ответа"""
+    name = serializers.CharField(max_length=256)
+    start_date = serializers.DateTimeField()
+    finish_date = serializers.DateTimeField()
+    description = serializers.CharField()
+    questions = serializers.ListField(child=QuestionTreeSerializer(), default=list)
+
+    def create(self, validated_data):
+        quiz_tree_create_controller = QuizTreeCreateController(validated_data)
+        return quiz_tree_create_controller.create()
+
+    def to_representation(self, instance):
+        data = QuizSerializer(instance['quiz']).data
+        data['questions'] = instance['questions']
+        return data
+
+
+class QuestionImportSerializer(QuestionTreeSerializer):
+    """Вопрос импортируемого опроса со стабильным внешним ключом"""
+    key = serializers.CharField(max_length=128)
+
+
+class QuizImportSerializer(QuizTreeCreateSerializer):
+    """Описание опроса из файла импорта"""
+    key = serializers.CharField(max_length=128)
+    questions = serializers.ListField(child=QuestionImportSerializer(), default=list)
+
+    def validate_questions(self, value):
+        keys = [question['key'] for question in value]
+        if len(keys) != len(set(keys)):
+            raise serializers.ValidationError(ERRORS['error_question_key_is_not_unique'])
+        return value
+
+
 class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
-        fields = '__all__'
+        # внешний ключ импорта не выводится в API
+        exclude = ['external_id']
 
 
 class QuestionItemSerializer(serializers.ModelSerializer):
@@ -77,45 +178,132 @@ class QuestionItemSerializer(serializers.ModelSerializer):
 
 
 class QuizRetreiveSerializer(serializers.ModelSerializer):
-    """Сериалайзер  для модели Quiz"""
+    """Описание ответа списка опросов для схемы API, сам ответ строит QuizListValuesSerializer"""
     questions = QuestionSerializer(read_only=True, many=True)
-    question_items = QuestionItemSerializer(read_only=True, many=True)
 
     class Meta:
         model = Quiz
-        fields = ['pk', 'name', 'start_date', 'finish_date', 'description', 'questions', 'question_items']
-        depth = 4
-
-
-class AnswerSerializer(serializers.ModelSerializer):
+        fields = ['pk', 'name', 'start_date', 'finish_date', 'description', 'questions']
+
+
+class ValuesSerializer:
+    """
+    Вывод строк values_list в формате ModelSerializer без создания объектов моделей.
+
+    План полей (имена, источники и преобразования) строится один раз по полям сериализатора:
+    значения полей из PASSTHROUGH_FIELDS выводятся как есть, остальные через to_representation поля.
+    """
+    PASSTHROUGH_FIELDS = (
+        serializers.IntegerField, serializers.CharField, serializers.BooleanField, serializers.ChoiceField,
+        serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField,
+    )
+    serializer_class: type
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._plan = None
+
+    @property
+    def plan(self) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple]:
+        if self._plan is None:
+            fields = [field for field in self.serializer_class().fields.values() if not field.write_only]
+            self._plan = (
+                tuple(field.field_name for field in fields),
+                tuple(field.source for field in fields),
+                tuple(
+                    (index, field.to_representation) for index, field in enumerate(fields)
+                    if not isinstance(field, self.PASSTHROUGH_FIELDS)
+                ),
+            )
+        return self._plan
+
+    @property
+    def sources(self) -> Tuple[str, ...]:
+        return self.plan[1]
+
+    def to_representation(self, rows: Iterable[tuple]) -> List[Dict]:
+        names, _, converters = self.plan
+        data = []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, convert in converters:
+                    if row[index] is not None:
+                        row[index] = convert(row[index])
+            data.append(dict(zip(names, row)))
+        return data
+
+
+class QuizListValuesSerializer:
+    """Список опросов с вопросами в формате QuizRetreiveSerializer одним запросом на страницу опросов и одним на вопросы"""
+    quiz = ValuesSerializer(QuizSerializer)
+    question = ValuesSerializer(QuestionSerializer)
+
+    @classmethod
+    def values(cls, queryset: QuerySet) -> QuerySet:
+        """Строки опросов для постраничного вывода: словари с ключом pk для KeysetPagination"""
+        return queryset.values(*cls.quiz.sources)
+
+    @classmethod
+    def data(cls, quizzes: Iterable[Dict]) -> List[Dict]:
+        data = cls.quiz.to_representation(tuple(quiz.values()) for quiz in quizzes)
+        questions = {}
+        for quiz in data:
+            quiz['questions'] = questions[quiz['pk']] = []
+
+        rows = Question.objects.filter(quiz_id__in=list(questions)).order_by('pk').values_list(*cls.question.sources)
+        for question in cls.question.to_representation(rows):
+            questions[question['quiz']].append(question)
+        return data
+
+
+class AnswerSerializer(serializers.Serializer):
     """Сеариализатор отвчетов"""
-
-    class Meta:
-        model = Answer
-        fields = ['text', 'question', 'answer_selected']
+    text = serializers.CharField(allow_null=True, allow_blank=True, default=None)
+    question = serializers.IntegerField()
+    answer_selected = serializers.ListField(child=serializers.IntegerField(), default=list)
+
+
+class QuizPassValidationMixin:
+    """Проверка ответов по индексу вопросов, загруженному одним проходом для всех прохождений"""
+
+    @staticmethod
+    def validate_passes(submissions):
+        index = QuestionItemIndex.from_submissions(submissions)
+        for submission in submissions:
+            for question_item in submission['questions']:
+                question = index.questions.get(question_item['question'])
+                if question is None:
+                    raise serializers.ValidationError(ERRORS['error_question_is_not_exist'])
+                question_item['question'] = question
+
+                if question.type == 'answer_text':
+                    if not isinstance(question_item['text'], str):
+                        raise serializers.ValidationError(ERRORS['error_question_answer_text_is_empty'])
+                elif question.type in ('answer_one_selected', 'answer_some_selected'):
+                    if len(question_item['answer_selected']) == 0:
+                        raise serializers.ValidationError(ERRORS['error_question_answer_items_length_is_zero'])
+                    elif question.type == 'answer_one_selected':
+                        if len(question_item['answer_selected']) > 1:
+                            raise serializers.ValidationError(ERRORS['error_question_answer_items_length_is_more_one'])
+
+                question_items = index.items[question.pk]
+                if not question_items.issuperset(question_item['answer_selected']):
+                    raise serializers.ValidationError(ERRORS['error_question_answer_items_not_belong_to_question'])
+                question_item['answer_selected'] = list(dict.fromkeys(question_item['answer_selected']))
+        return submissions
 
 
-class QuizPassSerializer(serializers.Serializer):
+class QuizPassSerializer(serializers.Serializer, QuizPassValidationMixin):
     """Сериализатор 'прохождения опросов'"""
-    user = serializers.CharField()
+    user = serializers.CharField(max_length=256)
     questions = serializers.ListField(child=AnswerSerializer())
 
     def validate(self, attrs):
-        for question_item in attrs['questions']:
-            if question_item['question'].type == 'answer_text':
-                if not isinstance(question_item['text'], str):
-                    raise serializers.ValidationError(ERRORS['error_question_answer_text_is_empty'])
-            elif question_item['question'].type in ('answer_one_selected', 'answer_some_selected'):
-                if len(question_item['answer_selected']) == 0:
-                    raise serializers.ValidationError(ERRORS['error_question_answer_items_length_is_zero'])
-                elif question_item['question'].type == 'answer_one_selected':
-                    if len(question_item['answer_selected']) > 1:
-                        raise serializers.ValidationError(ERRORS['error_question_answer_items_length_is_more_one'])
-
-            question_items_list = QuestionItem.objects.filter(question=question_item['question']).values_list('pk', flat=True)
-            for answer_item in question_item['answer_selected']:
-                if answer_item.pk not in question_items_list:
-                    raise serializers.ValidationError(ERRORS['error_question_answer_items_not_belong_to_question'])
+        if isinstance(self.parent, serializers.ListField):
+            # в пакетном режиме проверка выполняется один раз для всех прохождений
+            return attrs
+        self.validate_passes([attrs])
         return attrs
 
     def create(self, validated_data):
@@ -123,6 +311,19 @@ class QuizPassSerializer(serializers.Serializer):
         return answer.create()
 
 
+class QuizPassBatchSerializer(serializers.Serializer, QuizPassValidationMixin):
+    """Сериализатор пакетного 'прохождения опросов'"""
+    submissions = serializers.ListField(child=QuizPassSerializer(), allow_empty=False)
+
+    def validate(self, attrs):
+        self.validate_passes(attrs['submissions'])
+        return attrs
+
+    def create(self, validated_data):
+        answers = AnswerBulkCreateController(validated_data['submissions'])
+        return answers.create()
+
+
 class AnswerSchemaSerializer(serializers.Serializer):
     """Сериализатор необходим для вывода представления результата GET /quizzes/users/{user}/ OpenAPI"""
     id = serializers.IntegerField()
@@ -155,22 +356,28 @@ class QuizUserResultSerializer(serializers.Serializer):
     results_quizzes = serializers.ListField(child=QuizShemaSerializer1(), required=False)
 
     def validate_user(self, value):
-        try:
-            user = User.objects.get(name=value)
-        except User.DoesNotExist:
+        user_pk = UserController.get_pk(value)
+        if user_pk is None:
             raise serializers.ValidationError(ERRORS['error_user_does_not_exist'])
-        return user
+        return User(pk=user_pk, name=value)
 
     def validate(self, attrs):
         result = {}
         quiz_user_result = QuizUserResultController(attrs['user'])
+        include_history = self.context.get('include_history', False)
+        quiz_ids = None
+        paginator = self.context.get('paginator')
+        if paginator is not None:
+            quizzes = paginator.paginate_queryset(
+                quiz_user_result.quizzes(include_history).values('pk'), self.context['request']
+            )
+            quiz_ids = [quiz['pk'] for quiz in quizzes]
         result['user'] = attrs['user']
-        result['results_quizzes'] = quiz_user_result.reports()
+        result['results_quizzes'] = quiz_user_result.reports(quiz_ids, include_history)
         return result
 
     def to_representation(self, instance):
         results_quizzes = instance['results_quizzes']
-        print(f"instance {instance}")
         ret = super(QuizUserResultSerializer, self).to_representation(instance)
         ret['results_quizzes'] = results_quizzes
         return ret
\ No newline at end of file
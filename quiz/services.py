@@ -1,7 +1,19 @@
-from typing import Dict, List, Optional
+import csv
+import json
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Max, Min, Q, QuerySet
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Question, QuestionItem, Quiz, User, Answer
+from .cache import LRUCache, QuizDefinitionCache
+from .models import (
+    Question, QuestionItem, Quiz, User, Answer, QuestionStatistic, QuestionItemStatistic, ArchivedAnswers
+)
 from .errors import ERRORS
 
 
@@ -14,10 +26,20 @@ def check_quiz_is_exist(quiz_id: int) -> bool:
         return False
 
 
-def get_question_item_pk_and_name(question: Question) -> List[str]:
-    """Формирование списка QuestionItem"""
-    return [{'pk': item[0], 'name': item[1]} for item in QuestionItem.objects.filter(question=question).
-        values_list('pk', 'name')]
+def get_question_item_pk_and_name(question: Question) -> List[Dict]:
+    """Формирование списка QuestionItem из кэша дерева опроса"""
+    question_definition = QuizDefinitionCache.get_question(question.quiz_id, question.pk)
+    return question_definition['question_item'] if question_definition is not None else []
+
+
+def selected_items_inline() -> bool:
+    """Выбранные варианты ответа хранятся массивом в Answer.selected_items, а не в таблице связей"""
+    return settings.QUIZ_ANSWER_SELECTED_STORAGE == 'inline'
+
+
+def get_question_item_names(question_item_ids) -> Dict[int, str]:
+    """Названия вариантов ответа по pk одним запросом без соединения с ответами"""
+    return dict(QuestionItem.objects.filter(pk__in=set(question_item_ids)).values_list('pk', 'name'))
 
 
 def prepare_question_data_to_output(questin: Question, response_data: Dict[str, str]) -> Dict[str, str]:
@@ -29,58 +51,769 @@ def prepare_question_data_to_output(questin: Question, response_data: Dict[str,
     return data
 
 
+class UserController:
+    """Получение pk пользователей по имени через ограниченный кэш процесса с временем жизни"""
+    cache = LRUCache(settings.QUIZ_USER_CACHE_SIZE, settings.QUIZ_USER_CACHE_TTL)
+
+    @classmethod
+    def _remember(cls, users: Dict[str, int]) -> None:
+        """Кэширование только после фиксации транзакции, чтобы не запомнить pk откатившейся вставки"""
+        def remember():
+            for name, user_pk in users.items():
+                cls.cache.set(name, user_pk)
+        transaction.on_commit(remember)
+
+    @staticmethod
+    def _upsert(names: List[str]) -> Dict[str, int]:
+        """
+        Создание недостающих пользователей и получение pk всех переданных одним запросом на пачку.
+
+        ON CONFLICT DO NOTHING не блокирует существующие строки, а параллельная вставка того же
+        имени ждет фиксации первой и не падает с IntegrityError. Строки, вставленные параллельно
+        уже после начала запроса, не видны в его снимке и дочитываются отдельным SELECT.
+        """
+        quote_name = connection.ops.quote_name
+        table = quote_name(User._meta.db_table)
+        name_column = quote_name(User._meta.get_field('name').column)
+        pk_column = quote_name(User._meta.pk.column)
+        users = {}
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        with connection.cursor() as cursor:
+            for start in range(0, len(names), batch_size):
+                batch = names[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f"WITH created AS ("
+                    f"INSERT INTO {table} ({name_column}) VALUES {', '.join(['(%s)'] * len(batch))} "
+                    f"ON CONFLICT ({name_column}) DO NOTHING RETURNING {name_column}, {pk_column}) "
+                    f"SELECT {name_column}, {pk_column} FROM created "
+                    f"UNION ALL SELECT {name_column}, {pk_column} FROM {table} WHERE {name_column} IN ({placeholders})",
+                    batch + batch
+                )
+                users.update(cursor.fetchall())
+        missing = set(names) - users.keys()
+        if missing:
+            users.update(User.objects.filter(name__in=missing).values_list('name', 'pk'))
+        return users
+
+    @classmethod
+    def forget(cls, names: Iterable[str]) -> None:
+        for name in names:
+            cls.cache.delete(name)
+
+    @classmethod
+    def get_or_create_pks(cls, names: Set[str]) -> Dict[str, int]:
+        users = {}
+        missing = []
+        for name in names:
+            user_pk = cls.cache.get(name)
+            if user_pk is None:
+                missing.append(name)
+            else:
+                users[name] = user_pk
+        if missing:
+            created = cls._upsert(sorted(missing))
+            cls._remember(created)
+            users.update(created)
+        return users
+
+    @classmethod
+    def get_pk(cls, name: str) -> Optional[int]:
+        user_pk = cls.cache.get(name)
+        if user_pk is None:
+            user_pk = User.objects.filter(name=name).values_list('pk', flat=True).first()
+            if user_pk is not None:
+                cls._remember({name: user_pk})
+        return user_pk
+
+
+class QuestionItemIndex:
+    """Индекс вопросов и допустимых для них вариантов ответа, загружаемый двумя запросами"""
+    questions: Dict[int, Question]
+    items: Dict[int, Set[int]]
+
+    def __init__(self, question_ids):
+        self.questions = Question.objects.only('pk', 'quiz_id', 'type').in_bulk(set(question_ids))
+        self.items = {pk: set() for pk in self.questions}
+        question_items = QuestionItem.objects.filter(question_id__in=self.questions.keys()).values_list('pk', 'question_id')
+        for item_pk, question_pk in question_items:
+            self.items[question_pk].add(item_pk)
+
+    @classmethod
+    def from_submissions(cls, submissions: List[Dict]) -> 'QuestionItemIndex':
+        return cls(question_data['question'] for submission in submissions for question_data in submission['questions'])
+
+
 class QuizUserResultController:
     """Формировнаие результата пройденных пользователем опросов с детализацией"""
     user: User
-    questions: List
     answers_result: List
 
     def __init__(self, user):
         self.user = user
-        self.questions = []
         self.answers_result = []
 
-    def _add_questions_and_answers_rows_in_list(self, answers) -> None:
-        self.questions.append({
-            'id': answers.question.pk,
-            'text': answers.question.text,
-            'answers': {
-                'id': answers.pk,
-                'text': answers.text,
-                'answer_selected': [answer.name for answer in answers.answer_selected.all()]
-            }
-        })
-
-    def _add_questions_and_answers_list_into_result_list(self, answers, quiz_id: Optional) -> None:
-        self.answers_result.append({
-            'quiz': {
-                'id': answers.question.quiz.pk if quiz_id is None else quiz_id,
-                'name': answers.question.quiz.name,
-                'questions': self.questions.copy()
-            }
-        })
-        self.questions.clear()
-
-    def reports(self):
-        quiz_id = 0
-        for answers in Answer.objects.filter(user=self.user).order_by('question__quiz'):
-            print(f"quiz {answers.question.quiz.pk}")
-            if quiz_id == 0:
-                quiz_id = answers.question.quiz.pk
-                self._add_questions_and_answers_rows_in_list(answers)
-                continue
+    def quizzes(self, include_history=False):
+        """Опросы, на вопросы которых отвечал пользователь, с include_history - и опросы из архива"""
+        quizzes = Q(pk__in=Answer.objects.filter(user=self.user).values('question__quiz_id'))
+        if include_history:
+            quizzes |= Q(pk__in=ArchivedAnswers.objects.filter(user=self.user).values('quiz_id'))
+        return Quiz.objects.filter(quizzes)
+
+    def _get_answers_rows(self, quiz_ids: Optional[List[int]]):
+        """Ответы пользователя вместе с вопросом и опросом одним запросом"""
+        answers = Answer.objects.filter(user=self.user)
+        if quiz_ids is not None:
+            answers = answers.filter(question__quiz_id__in=quiz_ids)
+        return answers.order_by('question__quiz', 'pk').values_list(
+            'pk', 'text', 'question_id', 'question__text', 'question__quiz_id', 'question__quiz__name', 'selected_items'
+        )
 
-            if quiz_id == answers.question.quiz.pk:
-                self._add_questions_and_answers_rows_in_list(answers)
-            else:
-                if len(self.questions) > 0 or len(self.answers):
-                    self._add_questions_and_answers_list_into_result_list(answers, quiz_id)
-                quiz_id = answers.question.quiz.pk
-                self._add_questions_and_answers_rows_in_list(answers)
-                self._add_questions_and_answers_list_into_result_list(answers, None)
+    def _get_answer_selected(self, quiz_ids: Optional[List[int]], answers_rows: List[Tuple]) -> Dict[int, List[str]]:
+        """Названия выбранных вариантов ответа, сгруппированные по ответу"""
+        answer_selected = {}
+        if selected_items_inline():
+            names = get_question_item_names(item for row in answers_rows for item in row[-1] or [])
+            for row in answers_rows:
+                if row[-1]:
+                    answer_selected[row[0]] = [names[item] for item in row[-1] if item in names]
+            return answer_selected
+
+        rows = Answer.answer_selected.through.objects.filter(answer__user=self.user)
+        if quiz_ids is not None:
+            rows = rows.filter(answer__question__quiz_id__in=quiz_ids)
+        rows = rows.order_by('pk').values_list('answer_id', 'questionitem__name')
+        for answer_pk, name in rows:
+            answer_selected.setdefault(answer_pk, []).append(name)
+        return answer_selected
+
+    def _get_archived_rows(self, quiz_ids: Optional[List[int]]) -> List[Tuple]:
+        """Ответы пользователя из архива в виде строк ответов с названиями выбранных вариантов"""
+        archived = ArchivedAnswers.objects.filter(user=self.user)
+        if quiz_ids is not None:
+            archived = archived.filter(quiz_id__in=quiz_ids)
+        archived = list(archived.values_list('quiz_id', 'quiz__name', 'answers'))
+        if not archived:
+            return []
+
+        question_texts = dict(Question.objects.filter(
+            pk__in={answer[1] for _, _, answers in archived for answer in answers}
+        ).values_list('pk', 'text'))
+        names = get_question_item_names(item for _, _, answers in archived for answer in answers for item in answer[3])
+        rows = []
+        for quiz_id, quiz_name, answers in archived:
+            for answer_pk, question_pk, text, items in answers:
+                # ответы на удаленные после архивации вопросы пропускаются
+                if question_pk in question_texts:
+                    selected = [names[item] for item in items if item in names]
+                    rows.append((answer_pk, text, question_pk, question_texts[question_pk], quiz_id, quiz_name, selected))
+        return rows
+
+    def reports(self, quiz_ids: Optional[List[int]] = None, include_history=False):
+        """Результаты по всем опросам пользователя или только по опросам из quiz_ids"""
+        answers_rows = list(self._get_answers_rows(quiz_ids))
+        answer_selected = self._get_answer_selected(quiz_ids, answers_rows)
+        rows = [(*row[:-1], answer_selected.get(row[0], [])) for row in answers_rows]
+        if include_history:
+            rows = sorted(rows + self._get_archived_rows(quiz_ids), key=lambda row: (row[4], row[0]))
+
+        questions = None
+        quiz_id = None
+        for answer_pk, text, question_pk, question_text, answer_quiz_id, quiz_name, selected in rows:
+            if answer_quiz_id != quiz_id:
+                quiz_id = answer_quiz_id
+                questions = []
+                self.answers_result.append({
+                    'quiz': {
+                        'id': quiz_id,
+                        'name': quiz_name,
+                        'questions': questions
+                    }
+                })
+            questions.append({
+                'id': question_pk,
+                'text': question_text,
+                'answers': {
+                    'id': answer_pk,
+                    'text': text,
+                    'answer_selected': selected
+                }
+            })
         return self.answers_result
 
 
+class Echo:
+    """Объект-заглушка с методом write, возвращающим записанное значение, для csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+class QuizAnswersExportController:
+    """Потоковая выгрузка всех ответов опроса порциями фиксированного размера"""
+    EXPORT_FIELDS = ['id', 'user', 'question', 'question_text', 'text', 'answer_selected']
+    quiz_id: int
+    chunk_size: int
+
+    def __init__(self, quiz_id, chunk_size=None):
+        self.quiz_id = quiz_id
+        self.chunk_size = chunk_size or settings.QUIZ_EXPORT_CHUNK_SIZE
+        self.item_names = None
+
+    def _get_answers_rows(self):
+        """Ответы опроса, читаемые серверным курсором"""
+        return Answer.objects.filter(question__quiz_id=self.quiz_id).order_by('pk').values_list(
+            'pk', 'user__name', 'question_id', 'question__text', 'text', 'selected_items'
+        ).iterator(chunk_size=self.chunk_size)
+
+    def _get_item_names(self) -> Dict[int, str]:
+        """Названия вариантов ответа опроса из кэша дерева опроса"""
+        definition = QuizDefinitionCache.get(self.quiz_id) or {'questions': []}
+        return {
+            question_item['pk']: question_item['name']
+            for question in definition['questions']
+            for question_item in question['question_item']
+        }
+
+    def _get_answer_selected(self, chunk: List[Tuple]) -> Dict[int, List[str]]:
+        answer_selected = {}
+        if selected_items_inline():
+            if self.item_names is None:
+                self.item_names = self._get_item_names()
+            for row in chunk:
+                if row[-1]:
+                    answer_selected[row[0]] = [self.item_names[item] for item in row[-1] if item in self.item_names]
+            return answer_selected
+
+        rows = Answer.answer_selected.through.objects.filter(
+            answer_id__in=[row[0] for row in chunk]
+        ).order_by('pk').values_list('answer_id', 'questionitem__name')
+        for answer_pk, name in rows:
+            answer_selected.setdefault(answer_pk, []).append(name)
+        return answer_selected
+
+    def _rows_from_chunk(self, chunk: List[Tuple]) -> Iterator[Dict]:
+        answer_selected = self._get_answer_selected(chunk)
+        for answer_pk, user, question_pk, question_text, text, _ in chunk:
+            yield {
+                'id': answer_pk,
+                'user': user,
+                'question': question_pk,
+                'question_text': question_text,
+                'text': text,
+                'answer_selected': answer_selected.get(answer_pk, [])
+            }
+
+    def rows(self) -> Iterator[Dict]:
+        chunk = []
+        for row in self._get_answers_rows():
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                yield from self._rows_from_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._rows_from_chunk(chunk)
+
+    def to_ndjson(self) -> Iterator[str]:
+        for row in self.rows():
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+    def to_csv(self) -> Iterator[str]:
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.EXPORT_FIELDS)
+        for row in self.rows():
+            row['answer_selected'] = ';'.join(row['answer_selected'])
+            yield writer.writerow([row[field] for field in self.EXPORT_FIELDS])
+
+
+class QuizStatisticController:
+    """Счетчики ответов на вопросы и выборов вариантов ответа"""
+
+    @staticmethod
+    def _increment(model, key_field: str, count_field: str, counter: Counter) -> None:
+        """
+        Атомарное увеличение счетчиков одним INSERT ... ON CONFLICT DO UPDATE на пачку.
+
+        Ключи отсортированы, поэтому параллельные транзакции блокируют строки счетчиков
+        в одном порядке и не попадают во взаимную блокировку.
+        """
+        quote_name = connection.ops.quote_name
+        table = quote_name(model._meta.db_table)
+        key_column = quote_name(model._meta.get_field(key_field).column)
+        count_column = quote_name(model._meta.get_field(count_field).column)
+        rows = sorted(counter.items())
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f"INSERT INTO {table} ({key_column}, {count_column}) "
+                    f"VALUES {', '.join(['(%s, %s)'] * len(batch))} "
+                    f"ON CONFLICT ({key_column}) DO UPDATE "
+                    f"SET {count_column} = {table}.{count_column} + EXCLUDED.{count_column}",
+                    [value for row in batch for value in row]
+                )
+
+    @classmethod
+    def increment(cls, rows: List[Tuple[Answer, List]]) -> None:
+        questions = Counter(answer.question_id for answer, _ in rows)
+        question_items = Counter(getattr(item, 'pk', item) for _, items in rows for item in items)
+        cls._increment(QuestionStatistic, 'question', 'answers_count', questions)
+        cls._increment(QuestionItemStatistic, 'question_item', 'selected_count', question_items)
+
+    @staticmethod
+    def _get_inline_selected_count(questions) -> List[Tuple[int, int]]:
+        """Количество выборов существующих вариантов ответа по массивам Answer.selected_items"""
+        quote_name = connection.ops.quote_name
+        questions_sql, params = questions.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT item.{quote_name('id')}, COUNT(*) "
+                f"FROM {quote_name(Answer._meta.db_table)} answer "
+                f"CROSS JOIN LATERAL unnest(answer.{quote_name('selected_items')}) AS selected(item_id) "
+                f"JOIN {quote_name(QuestionItem._meta.db_table)} item ON item.{quote_name('id')} = selected.item_id "
+                f"WHERE answer.{quote_name('question_id')} IN ({questions_sql}) "
+                f"GROUP BY item.{quote_name('id')}",
+                params
+            )
+            return cursor.fetchall()
+
+    @staticmethod
+    def _get_archived_count(questions) -> Tuple[Counter, Counter]:
+        """Количество ответов на вопросы и выборов существующих вариантов в архиве ответов"""
+        quote_name = connection.ops.quote_name
+        questions_sql, params = questions.values('pk').query.sql_with_params()
+        source = (
+            f"{quote_name(ArchivedAnswers._meta.db_table)} archived "
+            f"CROSS JOIN LATERAL jsonb_array_elements(archived.answers) AS answer"
+        )
+        condition = f"(answer ->> 1)::integer IN ({questions_sql})"
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT (answer ->> 1)::integer, COUNT(*) FROM {source} WHERE {condition} GROUP BY 1", params)
+            answers_count = Counter(dict(cursor.fetchall()))
+            cursor.execute(
+                f"SELECT item.{quote_name('id')}, COUNT(*) FROM {source} "
+                f"CROSS JOIN LATERAL jsonb_array_elements_text(answer -> 3) AS selected(item_id) "
+                f"JOIN {quote_name(QuestionItem._meta.db_table)} item "
+                f"ON item.{quote_name('id')} = selected.item_id::integer "
+                f"WHERE {condition} GROUP BY item.{quote_name('id')}",
+                params
+            )
+            selected_count = Counter(dict(cursor.fetchall()))
+        return answers_count, selected_count
+
+    @classmethod
+    def rebuild(cls, quiz_id: Optional[int] = None) -> None:
+        """
+        Пересчет счетчиков с нуля по таблицам ответов и архиву.
+
+        Таблицы счетчиков блокируются до подсчета: прохождения, уже увеличившие счетчики, фиксируются
+        раньше подсчета и попадают в него, а новые ждут конца пересчета и увеличивают пересчитанные значения.
+        """
+        questions = Question.objects.all() if quiz_id is None else Question.objects.filter(quiz_id=quiz_id)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for model in (QuestionStatistic, QuestionItemStatistic):
+                    cursor.execute(
+                        f"LOCK TABLE {connection.ops.quote_name(model._meta.db_table)} IN SHARE ROW EXCLUSIVE MODE"
+                    )
+            cls._replace(questions)
+
+    @classmethod
+    def _replace(cls, questions: QuerySet) -> None:
+        answers_count = Counter(dict(Answer.objects.filter(question__in=questions).values('question_id').annotate(
+            count=Count('pk')
+        ).values_list('question_id', 'count')))
+        if selected_items_inline():
+            selected_count = Counter(dict(cls._get_inline_selected_count(questions)))
+        else:
+            selected_count = Counter(dict(Answer.answer_selected.through.objects.filter(
+                questionitem__question__in=questions
+            ).values('questionitem_id').annotate(count=Count('pk')).values_list('questionitem_id', 'count')))
+        archived_answers_count, archived_selected_count = cls._get_archived_count(questions)
+        answers_count += archived_answers_count
+        selected_count += archived_selected_count
+
+        QuestionStatistic.objects.filter(question__in=questions).delete()
+        QuestionItemStatistic.objects.filter(question_item__question__in=questions).delete()
+        QuestionStatistic.objects.bulk_create([
+            QuestionStatistic(question_id=question_pk, answers_count=count) for question_pk, count in answers_count.items()
+        ], batch_size=settings.QUIZ_PASS_BULK_BATCH_SIZE)
+        QuestionItemStatistic.objects.bulk_create([
+            QuestionItemStatistic(question_item_id=item_pk, selected_count=count) for item_pk, count in selected_count.items()
+        ], batch_size=settings.QUIZ_PASS_BULK_BATCH_SIZE)
+
+    @staticmethod
+    def statistics(quiz: Dict) -> Dict:
+        """Статистика опроса из таблиц счетчиков, без агрегации по ответам"""
+        question_items = {}
+        rows = QuestionItem.objects.filter(question__quiz_id=quiz['id']).order_by('pk').values_list(
+            'question_id', 'pk', 'name', 'statistic__selected_count'
+        )
+        for question_pk, item_pk, name, selected_count in rows:
+            question_items.setdefault(question_pk, []).append({
+                'pk': item_pk,
+                'name': name,
+                'selected_count': selected_count or 0
+            })
+
+        rows = Question.objects.filter(quiz_id=quiz['id']).order_by('pk').values_list(
+            'pk', 'text', 'type', 'statistic__answers_count'
+        )
+        quiz['questions'] = [{
+            'pk': question_pk,
+            'text': text,
+            'type': question_type,
+            'answers_count': answers_count or 0,
+            'question_item': question_items.get(question_pk, [])
+        } for question_pk, text, question_type, answers_count in rows]
+        return quiz
+
+
+class QuizCrosstabController:
+    """
+    Таблица сопряженности выборов вариантов ответа двух вопросов опроса.
+
+    Строки (вопрос, пользователь, вариант) читаются серверным курсором в порядке пользователей
+    и обрабатываются блоками: варианты кодируются индексами, для пользователей блока строятся
+    индикаторные матрицы A и B, а таблица накапливается как A.T @ B. Память ограничена
+    размером блока QUIZ_CROSSTAB_BLOCK_SIZE (ячеек матриц), а не количеством ответов.
+    """
+    quiz_id: int
+    question_a: Dict
+    question_b: Dict
+
+    def __init__(self, quiz_id, question_a, question_b, block_size=None):
+        self.quiz_id = quiz_id
+        self.question_a = question_a
+        self.question_b = question_b
+        self.item_pks = [
+            np.array([item['pk'] for item in question['question_item']], dtype=np.int64)
+            for question in (question_a, question_b)
+        ]
+        columns = sum(len(item_pks) for item_pks in self.item_pks)
+        self.block_rows = max((block_size or settings.QUIZ_CROSSTAB_BLOCK_SIZE) // max(columns, 1), 1)
+        self.matrix = np.zeros((len(self.item_pks[0]), len(self.item_pks[1])), dtype=np.int64)
+        self.item_respondents = [np.zeros(len(item_pks), dtype=np.int64) for item_pks in self.item_pks]
+        self.respondents = 0
+
+    def _get_rows_sql(self) -> str:
+        quote_name = connection.ops.quote_name
+        answer_table = quote_name(Answer._meta.db_table)
+        if selected_items_inline():
+            source = f"{answer_table} answer CROSS JOIN LATERAL unnest(answer.selected_items) AS selected(item_id)"
+            item_column = 'selected.item_id'
+        else:
+            through = Answer.answer_selected.through
+            source = (
+                f"{answer_table} answer JOIN {quote_name(through._meta.db_table)} selected "
+                f"ON selected.{quote_name(through._meta.get_field('answer').column)} = answer.id"
+            )
+            item_column = f"selected.{quote_name(through._meta.get_field('questionitem').column)}"
+        return (
+            f"SELECT answer.question_id, answer.user_id, {item_column} FROM {source} "
+            f"WHERE answer.question_id IN (%s, %s) ORDER BY answer.user_id"
+        )
+
+    def _indicator(self, rows: np.ndarray, user_codes: np.ndarray, users: int, side: int) -> np.ndarray:
+        """Матрица пользователь x вариант вопроса: 1, если пользователь выбирал вариант"""
+        question = (self.question_a, self.question_b)[side]
+        item_pks = self.item_pks[side]
+        mask = rows[:, 0] == question['pk']
+        items = rows[mask, 2]
+        codes = np.minimum(np.searchsorted(item_pks, items), max(len(item_pks) - 1, 0))
+        # варианты, удаленные после ответа, отбрасываются
+        valid = item_pks[codes] == items if len(item_pks) else np.zeros(len(items), dtype=bool)
+        indicator = np.zeros((users, len(item_pks)), dtype=np.float32)
+        indicator[user_codes[mask][valid], codes[valid]] = 1
+        return indicator
+
+    def _accumulate(self, rows: np.ndarray) -> None:
+        _, user_codes = np.unique(rows[:, 1], return_inverse=True)
+        users = int(user_codes.max()) + 1
+        indicator_a = self._indicator(rows, user_codes, users, 0)
+        indicator_b = self._indicator(rows, user_codes, users, 1)
+        self.matrix += np.rint(indicator_a.T @ indicator_b).astype(np.int64)
+        self.item_respondents[0] += np.rint(indicator_a.sum(axis=0)).astype(np.int64)
+        self.item_respondents[1] += np.rint(indicator_b.sum(axis=0)).astype(np.int64)
+        self.respondents += int(np.count_nonzero(indicator_a.any(axis=1) & indicator_b.any(axis=1)))
+
+    def compute(self) -> Dict:
+        carry = np.empty((0, 3), dtype=np.int64)
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(self._get_rows_sql(), [self.question_a['pk'], self.question_b['pk']])
+            while True:
+                fetched = cursor.fetchmany(self.block_rows)
+                if not fetched:
+                    break
+                rows = np.concatenate([carry, np.array(fetched, dtype=np.int64)])
+                # строки последнего пользователя могут продолжиться в следующей порции
+                split = int(np.searchsorted(rows[:, 1], rows[-1, 1]))
+                if split:
+                    self._accumulate(rows[:split])
+                carry = rows[split:]
+        if len(carry):
+            self._accumulate(carry)
+
+        return {
+            'quiz': self.quiz_id,
+            'respondents': self.respondents,
+            'question_a': self._question_to_output(0),
+            'question_b': self._question_to_output(1),
+            'matrix': self.matrix.tolist(),
+        }
+
+    def _question_to_output(self, side: int) -> Dict:
+        question = (self.question_a, self.question_b)[side]
+        return {
+            'pk': question['pk'],
+            'text': question['text'],
+            'question_item': [{
+                'pk': item['pk'],
+                'name': item['name'],
+                'respondents': int(respondents)
+            } for item, respondents in zip(question['question_item'], self.item_respondents[side])]
+        }
+
+
+class AnswerBulkCreateController:
+    """Пакетное сохранение результатов прохождения опросов одной транзакцией"""
+    submissions: List[Dict]
+
+    def __init__(self, submissions):
+        self.submissions = submissions
+
+    def _build_answers(self, users: Dict[str, int]) -> List[Tuple[Answer, List]]:
+        inline = selected_items_inline()
+        rows = []
+        for submission in self.submissions:
+            user_pk = users[submission['user']]
+            for question_data in submission['questions']:
+                answer_selected = question_data.get('answer_selected', [])
+                answer = Answer(
+                    user_id=user_pk,
+                    text=question_data.get('text'),
+                    question_id=getattr(question_data['question'], 'pk', question_data['question'])
+                )
+                if inline and answer_selected:
+                    answer.selected_items = [getattr(item, 'pk', item) for item in answer_selected]
+                rows.append((answer, answer_selected))
+        return rows
+
+    @staticmethod
+    def _build_answer_selected(rows: List[Tuple[Answer, List]]) -> List:
+        through = Answer.answer_selected.through
+        return [
+            through(answer_id=answer.pk, questionitem_id=getattr(item, 'pk', item))
+            for answer, items in rows
+            for item in items
+        ]
+
+    def create(self) -> List[Answer]:
+        if not self.submissions:
+            return []
+        # пользователи создаются до транзакции ответов, чтобы не держать блокировки новых строк до ее конца
+        names = {submission['user'] for submission in self.submissions}
+        cached = any(UserController.cache.get(name) is not None for name in names)
+        try:
+            return self._create(UserController.get_or_create_pks(names), check_users=cached)
+        except IntegrityError:
+            # pk из кэша процесса устаревает, если пользователя удалили в другом процессе
+            UserController.forget(names)
+            return self._create(UserController.get_or_create_pks(names))
+
+    def _create(self, users: Dict[str, int], check_users=False) -> List[Answer]:
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        check_users = check_users and connection.in_atomic_block
+        with transaction.atomic():
+            rows = self._build_answers(users)
+            answers = Answer.objects.bulk_create([answer for answer, _ in rows], batch_size=batch_size)
+            if not selected_items_inline():
+                Answer.answer_selected.through.objects.bulk_create(
+                    self._build_answer_selected(rows), batch_size=batch_size
+                )
+            QuizStatisticController.increment(rows)
+            if check_users:
+                # внешние ключи проверяются при фиксации, во внешней транзакции ошибка pk из кэша
+                # появилась бы уже после повтора
+                connection.check_constraints()
+        return answers
+
+
+class AnswerSelectedStorageController:
+    """
+    Перенос выбранных вариантов ответа между таблицей связей Answer.answer_selected
+    и массивом Answer.selected_items диапазонами pk ответов, по транзакции на диапазон.
+    """
+    batch_size: int
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.QUIZ_EXPORT_CHUNK_SIZE
+        quote_name = connection.ops.quote_name
+        through = Answer.answer_selected.through
+        self.answer_table = quote_name(Answer._meta.db_table)
+        self.through_table = quote_name(through._meta.db_table)
+        self.item_table = quote_name(QuestionItem._meta.db_table)
+        self.answer_column = quote_name(through._meta.get_field('answer').column)
+        self.item_column = quote_name(through._meta.get_field('questionitem').column)
+
+    def _ranges(self) -> Iterator[Tuple[int, int]]:
+        bounds = Answer.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return
+        for start in range(bounds['first'], bounds['last'] + 1, self.batch_size):
+            yield start, start + self.batch_size - 1
+
+    def to_inline(self, keep_source=False) -> int:
+        """Заполнение selected_items из таблицы связей, возвращает количество обновленных ответов"""
+        moved = 0
+        for start, end in self._ranges():
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {self.answer_table} answer SET selected_items = selected.items "
+                    f"FROM (SELECT {self.answer_column} AS answer_id, "
+                    f"array_agg({self.item_column} ORDER BY id) AS items FROM {self.through_table} "
+                    f"WHERE {self.answer_column} BETWEEN %s AND %s GROUP BY {self.answer_column}) selected "
+                    f"WHERE answer.id = selected.answer_id",
+                    [start, end]
+                )
+                moved += cursor.rowcount
+                if not keep_source:
+                    cursor.execute(
+                        f"DELETE FROM {self.through_table} WHERE {self.answer_column} BETWEEN %s AND %s", [start, end]
+                    )
+        return moved
+
+    def to_m2m(self, keep_source=False) -> int:
+        """Перенос selected_items в таблицу связей, варианты удаленные после ответа пропускаются"""
+        moved = 0
+        for start, end in self._ranges():
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {self.through_table} ({self.answer_column}, {self.item_column}) "
+                    f"SELECT answer.id, selected.item_id FROM {self.answer_table} answer "
+                    f"CROSS JOIN LATERAL unnest(answer.selected_items) WITH ORDINALITY AS selected(item_id, position) "
+                    f"JOIN {self.item_table} item ON item.id = selected.item_id "
+                    f"WHERE answer.id BETWEEN %s AND %s ORDER BY answer.id, selected.position "
+                    f"ON CONFLICT DO NOTHING",
+                    [start, end]
+                )
+                moved += cursor.rowcount
+                if not keep_source:
+                    cursor.execute(
+                        f"UPDATE {self.answer_table} SET selected_items = NULL "
+                        f"WHERE id BETWEEN %s AND %s AND selected_items IS NOT NULL",
+                        [start, end]
+                    )
+        return moved
+
+
+class QuizAnswerArchiveController:
+    """
+    Перенос ответов завершенных опросов из Answer и таблицы связей в ArchivedAnswers и обратно.
+
+    Ответы пользователя на опрос сворачиваются в одну строку архива с JSON массивом ответов.
+    Перенос идет диапазонами pk пользователей, по транзакции на диапазон, поэтому его можно
+    прервать и продолжить повторным запуском. Ответы, добавленные после архивации, при
+    следующем запуске дописываются к строке архива пользователя.
+    """
+    chunk_size: int
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.QUIZ_ARCHIVE_CHUNK_SIZE
+        quote_name = connection.ops.quote_name
+        through = Answer.answer_selected.through
+        self.archive_table = quote_name(ArchivedAnswers._meta.db_table)
+        self.answer_table = quote_name(Answer._meta.db_table)
+        self.question_table = quote_name(Question._meta.db_table)
+        self.through_table = quote_name(through._meta.db_table)
+        self.answer_column = quote_name(through._meta.get_field('answer').column)
+        self.item_column = quote_name(through._meta.get_field('questionitem').column)
+
+    @staticmethod
+    def finished_quizzes(finished_before) -> List[int]:
+        """Завершенные до finished_before опросы, у которых есть ответы в основных таблицах"""
+        return list(Answer.objects.filter(question__quiz__finish_date__lt=finished_before).order_by(
+            'question__quiz_id'
+        ).values_list('question__quiz_id', flat=True).distinct())
+
+    def _user_ranges(self, answers) -> Iterator[Tuple[int, int]]:
+        bounds = answers.aggregate(first=Min('user_id'), last=Max('user_id'))
+        if bounds['first'] is None:
+            return
+        for start in range(bounds['first'], bounds['last'] + 1, self.chunk_size):
+            yield start, start + self.chunk_size - 1
+
+    def _archive_users(self, quiz_id: int, start: int, end: int) -> int:
+        selected_items = (
+            f"COALESCE(to_jsonb(answer.selected_items), (SELECT COALESCE(jsonb_agg(selected.{self.item_column} "
+            f"ORDER BY selected.id), '[]') FROM {self.through_table} selected "
+            f"WHERE selected.{self.answer_column} = answer.id))"
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            # набор ответов фиксируется и блокируется один раз: ответ, добавленный во время переноса,
+            # не попадет в удаление без архивации и будет перенесен следующим запуском
+            cursor.execute(
+                f"SELECT answer.id FROM {self.answer_table} answer "
+                f"JOIN {self.question_table} question ON question.id = answer.question_id "
+                f"WHERE question.quiz_id = %s AND answer.user_id BETWEEN %s AND %s FOR UPDATE OF answer",
+                [quiz_id, start, end]
+            )
+            answer_ids = [answer_pk for answer_pk, in cursor.fetchall()]
+            if not answer_ids:
+                return 0
+            cursor.execute(
+                f"INSERT INTO {self.archive_table} (quiz_id, user_id, answers, archived_at) "
+                f"SELECT %s, answer.user_id, jsonb_agg(jsonb_build_array("
+                f"answer.id, answer.question_id, answer.text, {selected_items}) ORDER BY answer.id), %s "
+                f"FROM {self.answer_table} answer WHERE answer.id = ANY(%s) GROUP BY answer.user_id "
+                f"ON CONFLICT (quiz_id, user_id) DO UPDATE "
+                f"SET answers = {self.archive_table}.answers || EXCLUDED.answers, archived_at = EXCLUDED.archived_at",
+                [quiz_id, timezone.now(), answer_ids]
+            )
+            archived = cursor.rowcount
+            cursor.execute(f"DELETE FROM {self.through_table} WHERE {self.answer_column} = ANY(%s)", [answer_ids])
+            cursor.execute(f"DELETE FROM {self.answer_table} WHERE id = ANY(%s)", [answer_ids])
+        return archived
+
+    def archive(self, quiz_id: int) -> int:
+        """Архивация всех ответов опроса, возвращает количество строк архива (пользователей)"""
+        answers = Answer.objects.filter(question__quiz_id=quiz_id)
+        return sum(self._archive_users(quiz_id, start, end) for start, end in self._user_ranges(answers))
+
+    def restore(self, quiz_id: int) -> int:
+        """Возврат ответов опроса из архива в основные таблицы с исходными pk, возвращает количество ответов"""
+        restored = 0
+        inline = selected_items_inline()
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        archived = ArchivedAnswers.objects.filter(quiz_id=quiz_id)
+        for start, end in self._user_ranges(archived):
+            with transaction.atomic():
+                rows = list(archived.filter(user__gte=start, user__lte=end).values_list('user_id', 'answers'))
+                # вопросы и варианты, удаленные после архивации, пропускаются
+                index = QuestionItemIndex(answer[1] for _, answers in rows for answer in answers)
+                answers, answer_selected = [], []
+                for user_pk, user_answers in rows:
+                    for answer_pk, question_pk, text, items in user_answers:
+                        if question_pk not in index.questions:
+                            continue
+                        items = [item for item in items if item in index.items[question_pk]]
+                        answers.append(Answer(
+                            pk=answer_pk, user_id=user_pk, question_id=question_pk, text=text,
+                            selected_items=items if inline and items else None
+                        ))
+                        if not inline:
+                            answer_selected.extend((answer_pk, item) for item in items)
+                Answer.objects.bulk_create(answers, batch_size=batch_size)
+                through = Answer.answer_selected.through
+                through.objects.bulk_create([
+                    through(answer_id=answer_pk, questionitem_id=item) for answer_pk, item in answer_selected
+                ], batch_size=batch_size)
+                archived.filter(user__gte=start, user__lte=end).delete()
+            restored += len(answers)
+        return restored
+
+
 class AnswerCreateController:
     """Сохранение результата прохождения опроса"""
     data: Dict[str, str]
@@ -88,18 +821,8 @@ class AnswerCreateController:
     def __init__(self, data):
         self.data = data
 
-    def create(self) -> None:
-        answers = []
-        user, _ = User.objects.get_or_create(name=self.data['user'])
-        for question_data in self.data['questions']:
-            answer = Answer.objects.create(
-                user=user,
-                text=question_data['text'],
-                question=question_data['question']
-            )
-            answer.answer_selected.set(question_data['answer_selected'])
-            answers.append(answer)
-        return answers
+    def create(self) -> List[Answer]:
+        return AnswerBulkCreateController([self.data]).create()
 
 
 class QuestionItemCreateMixin:
@@ -107,11 +830,9 @@ class QuestionItemCreateMixin:
 
     @staticmethod
     def _create_question_item(question: Question, list_questions: List[str]) -> None:
-        for question_item in list_questions:
-            QuestionItem(
-                name=question_item,
-                question=question
-            ).save()
+        QuestionItem.objects.bulk_create([
+            QuestionItem(name=question_item, question=question) for question_item in list_questions
+        ], batch_size=settings.QUIZ_PASS_BULK_BATCH_SIZE)
 
 
 class QuestionCreateController(QuestionItemCreateMixin):
@@ -123,9 +844,8 @@ class QuestionCreateController(QuestionItemCreateMixin):
 
     def _create_with_answer_text(self) -> Question:
         """Создание вопроса с текстовым ответом"""
-        quiz = Quiz.objects.get(pk=self.data['quiz'])
         question = Question(
-            quiz=quiz,
+            quiz_id=self.data['quiz'],
             text=self.data['text'],
             type=self.data['type']
         )
@@ -142,16 +862,56 @@ class QuestionCreateController(QuestionItemCreateMixin):
 
     def create(self) -> Question:
         if check_quiz_is_exist(self.data['quiz']):
-            if self.data.get('type') in ('answer_one_selected', 'answer_some_selected'):
-                return self._create_with_selected_answer()
-            elif self.data.get('type') == 'answer_text':
-                return self._create_with_answer_text()
-            else:
-                raise serializers.ValidationError(ERRORS['error_type_question_is_not_exist'])
+            with transaction.atomic():
+                if self.data.get('type') in ('answer_one_selected', 'answer_some_selected'):
+                    question = self._create_with_selected_answer()
+                elif self.data.get('type') == 'answer_text':
+                    question = self._create_with_answer_text()
+                else:
+                    raise serializers.ValidationError(ERRORS['error_type_question_is_not_exist'])
+            return question
         else:
             raise serializers.ValidationError(ERRORS['error_quiz_is_not_exist'])
 
 
+class QuizTreeCreateController:
+    """Создание опроса вместе с вопросами и вариантами ответа одной транзакцией"""
+    data: Dict
+
+    def __init__(self, data):
+        self.data = data
+
+    def create(self) -> Dict:
+        questions_data = self.data.pop('questions')
+        batch_size = settings.QUIZ_PASS_BULK_BATCH_SIZE
+        with transaction.atomic():
+            quiz = Quiz.objects.create(**self.data)
+            questions = Question.objects.bulk_create([
+                Question(quiz=quiz, text=question_data['text'], type=question_data['type'])
+                for question_data in questions_data
+            ], batch_size=batch_size)
+            question_items = QuestionItem.objects.bulk_create([
+                QuestionItem(question=question, name=name)
+                for question, question_data in zip(questions, questions_data)
+                for name in question_data.get('question_item') or []
+            ], batch_size=batch_size)
+
+        items_by_question = {}
+        for question_item in question_items:
+            items_by_question.setdefault(question_item.question_id, []).append(
+                {'pk': question_item.pk, 'name': question_item.name}
+            )
+        return {
+            'quiz': quiz,
+            'questions': [{
+                'pk': question.pk,
+                'text': question.text,
+                'type': question.type,
+                'question_item': items_by_question.get(question.pk, [])
+            } for question in questions]
+        }
+
+
 class QuestionUpdateController(QuestionItemCreateMixin):
     """Изменения вопросов"""
     data: Dict[str, str]
@@ -161,16 +921,57 @@ class QuestionUpdateController(QuestionItemCreateMixin):
         self.data = data
         self.instance = instance
 
-    def _delete_all_question_items(self):
-        QuestionItem.objects.filter(question=self.instance).delete()
+    def _update_question_items(self, question_items: List) -> None:
+        """
+        Обновление вариантов ответа по разнице с существующими.
+
+        Элемент списка - название варианта или {'pk': ..., 'name': ...} существующего варианта,
+        форма элементов проверена QuestionUpdateSerializer. Варианты с совпадающим названием или pk
+        сохраняют pk и ответы пользователей, новые создаются, а отсутствующие в списке удаляются.
+        """
+        existing = dict(QuestionItem.objects.filter(question=self.instance).order_by('pk').values_list('pk', 'name'))
+        unclaimed = {}
+        for item_pk, name in existing.items():
+            unclaimed.setdefault(name, []).append(item_pk)
+
+        kept = set()
+        renamed = []
+        for question_item in question_items:
+            if not isinstance(question_item, dict):
+                continue
+            item_pk = question_item['pk']
+            if item_pk not in existing:
+                raise serializers.ValidationError(ERRORS['error_question_item_not_belong_to_question'])
+            if item_pk in kept:
+                continue
+            kept.add(item_pk)
+            unclaimed[existing[item_pk]].remove(item_pk)
+            name = question_item.get('name', existing[item_pk])
+            if name != existing[item_pk]:
+                renamed.append(QuestionItem(pk=item_pk, name=name))
+
+        created = []
+        for question_item in question_items:
+            if isinstance(question_item, dict):
+                continue
+            if unclaimed.get(question_item):
+                kept.add(unclaimed[question_item].pop(0))
+            else:
+                created.append(question_item)
+
+        QuestionItem.objects.bulk_update(renamed, ['name'], batch_size=settings.QUIZ_PASS_BULK_BATCH_SIZE)
+        removed = existing.keys() - kept
+        if removed:
+            QuestionItem.objects.filter(pk__in=removed).delete()
+        self._create_question_item(self.instance, created)
 
     def update(self):
-        if self.data.get('question_item'):
-            self._delete_all_question_items()
-            self._create_question_item(self.instance, self.data.get('question_item'))
-            del self.data['question_item']
-
-        for key in self.data.keys():
-            setattr(self.instance, key, self.data[key])
-        self.instance.save()
+        with transaction.atomic():
+            if self.data.get('question_item'):
+                self._update_question_items(self.data.get('question_item'))
+                del self.data['question_item']
+
+            for key in self.data.keys():
+                setattr(self.instance, key, self.data[key])
+            self.instance.save()
         return self.instance
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import QuizDefinitionCache
+from .models import Quiz, Question, User
+from .services import UserController
+
+# Приемников у QuestionItem нет: с ними каскадное удаление вариантов опроса загружает каждый вариант
+# и ищет его опрос отдельным запросом. Варианты меняются через представления, контроллеры вопросов,
+# импорт и админку, которые сбрасывают кэш опроса один раз на изменение.
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def invalidate_quiz(sender, instance: Quiz, **kwargs) -> None:
+    QuizDefinitionCache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question(sender, instance: Question, **kwargs) -> None:
+    QuizDefinitionCache.invalidate(instance.quiz_id)
+
+
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance: User, **kwargs) -> None:
+    """Кэш pk пользователей других процессов устаревает до истечения времени жизни, см. AnswerBulkCreateController"""
+    UserController.forget([instance.name])
@@ -0,0 +1,224 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+from .models import SubmissionSpoolCheckpoint
+from .services import AnswerBulkCreateController, QuestionItemIndex
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionSpool:
+    """
+    Локальный журнал прохождений опросов для отложенной записи в базу.
+
+    Веб-процессы дописывают проверенные прохождения в файл current.ndjson под flock.
+    Фоновый обработчик переименовывает его в сегмент и переносит сегменты в базу пачками;
+    смещение обработанной части сегмента сохраняется в той же транзакции, что и ответы,
+    поэтому после падения обработчика запись продолжается с места остановки без дублей.
+    Записи, которые не удается записать в базу, переносятся в dead-letter.ndjson, и обработка идет дальше.
+    """
+    CURRENT = 'current.ndjson'
+    SEGMENT_PREFIX = 'segment-'
+    DEAD_LETTER = 'dead-letter.ndjson'
+    # ошибки данных записи; ошибки соединения с базой пробрасываются, и сегмент записывается повторно
+    RECORD_ERRORS = (DataError, IntegrityError, KeyError, TypeError, ValueError)
+    directory: str
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.QUIZ_PASS_SPOOL_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def current_path(self) -> str:
+        return os.path.join(self.directory, self.CURRENT)
+
+    @property
+    def dead_letter_path(self) -> str:
+        return os.path.join(self.directory, self.DEAD_LETTER)
+
+    @staticmethod
+    def _to_record(submission: Dict) -> Dict:
+        return {
+            'ts': time.time(),
+            'user': submission['user'],
+            'questions': [{
+                'question': getattr(question_data['question'], 'pk', question_data['question']),
+                'text': question_data.get('text'),
+                'answer_selected': [getattr(item, 'pk', item) for item in question_data.get('answer_selected', [])]
+            } for question_data in submission['questions']]
+        }
+
+    def _open_current(self):
+        """Открытие текущего файла под эксклюзивной блокировкой с проверкой, что он не был переименован"""
+        while True:
+            spool_file = open(self.current_path, 'a', encoding='utf-8')
+            fcntl.flock(spool_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(spool_file.fileno()).st_ino == os.stat(self.current_path).st_ino:
+                    return spool_file
+            except FileNotFoundError:
+                pass
+            spool_file.close()
+
+    def append(self, submissions: List[Dict]) -> None:
+        data = ''.join(json.dumps(self._to_record(submission), ensure_ascii=False) + '\n' for submission in submissions)
+        spool_file = self._open_current()
+        try:
+            spool_file.write(data)
+            spool_file.flush()
+            if settings.QUIZ_PASS_SPOOL_FSYNC:
+                os.fsync(spool_file.fileno())
+        finally:
+            spool_file.close()
+
+    def rotate(self) -> Optional[str]:
+        """Перевод непустого текущего файла в сегмент, готовый к записи в базу"""
+        if not os.path.exists(self.current_path):
+            return None
+        spool_file = self._open_current()
+        try:
+            if os.fstat(spool_file.fileno()).st_size == 0:
+                return None
+            segment = os.path.join(self.directory, f'{self.SEGMENT_PREFIX}{time.time_ns()}.ndjson')
+            os.rename(self.current_path, segment)
+            return segment
+        finally:
+            spool_file.close()
+
+    def segments(self) -> List[str]:
+        names = sorted(name for name in os.listdir(self.directory) if name.startswith(self.SEGMENT_PREFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    @staticmethod
+    def _get_offset(segment: str) -> int:
+        checkpoint = SubmissionSpoolCheckpoint.objects.filter(segment=os.path.basename(segment)).first()
+        return checkpoint.offset if checkpoint is not None else 0
+
+    @staticmethod
+    def _read_records(segment: str, offset: int) -> Iterator[Tuple[Optional[Dict], int]]:
+        """Записи сегмента начиная со смещения вместе со смещением конца каждой записи"""
+        with open(segment, 'rb') as segment_file:
+            segment_file.seek(offset)
+            for line in segment_file:
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    logger.warning('Skip incomplete record at the end of %s', segment)
+                    yield None, offset
+                    continue
+                try:
+                    yield json.loads(line), offset
+                except ValueError:
+                    logger.warning('Skip broken record in %s at offset %s', segment, offset)
+                    yield None, offset
+
+    @staticmethod
+    def _revalidate(records: List[Dict]) -> List[Dict]:
+        """Отбрасывание ответов на вопросы и варианты, удаленные после записи в журнал; исходные записи не изменяются"""
+        index = QuestionItemIndex.from_submissions(records)
+        revalidated = []
+        for record in records:
+            questions = []
+            for question_data in record['questions']:
+                question = index.questions.get(question_data['question'])
+                if question is None:
+                    continue
+                questions.append({
+                    **question_data,
+                    'question': question,
+                    'answer_selected': [
+                        item for item in question_data['answer_selected'] if item in index.items[question.pk]
+                    ]
+                })
+            revalidated.append({**record, 'questions': questions})
+        return revalidated
+
+    @staticmethod
+    def _save_offset(segment: str, offset: int) -> None:
+        SubmissionSpoolCheckpoint.objects.update_or_create(segment=os.path.basename(segment), defaults={'offset': offset})
+
+    def _write_batch(self, segment: str, records: List[Dict], offset: int) -> None:
+        with transaction.atomic():
+            AnswerBulkCreateController(self._revalidate(records)).create()
+            self._save_offset(segment, offset)
+
+    def _dead_letter(self, segment: str, record: Dict, offset: int, error: Exception) -> None:
+        """Перенос записи в dead-letter файл со сдвигом смещения сегмента за нее"""
+        logger.error('Move record of %s at offset %s to %s: %r', segment, offset, self.DEAD_LETTER, error)
+        entry = {'segment': os.path.basename(segment), 'offset': offset, 'error': repr(error), 'record': record}
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as dead_letter_file:
+            dead_letter_file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            dead_letter_file.flush()
+            os.fsync(dead_letter_file.fileno())
+        self._save_offset(segment, offset)
+
+    def _flush_batch(self, segment: str, batch: List[Tuple[Dict, int]]) -> None:
+        """Запись пачки одной транзакцией, при ошибке данных - по одной записи, чтобы отделить ошибочные"""
+        try:
+            self._write_batch(segment, [record for record, _ in batch], batch[-1][1])
+            return
+        except self.RECORD_ERRORS as error:
+            if len(batch) == 1:
+                self._dead_letter(segment, batch[0][0], batch[0][1], error)
+                return
+        for record, offset in batch:
+            try:
+                self._write_batch(segment, [record], offset)
+            except self.RECORD_ERRORS as error:
+                self._dead_letter(segment, record, offset, error)
+
+    def flush_segment(self, segment: str, flush_size: int) -> int:
+        """Запись сегмента в базу пачками по flush_size прохождений, возвращает число обработанных прохождений"""
+        flushed = 0
+        batch = []
+        offset = self._get_offset(segment)
+        for record, offset in self._read_records(segment, offset):
+            if record is not None:
+                batch.append((record, offset))
+            if len(batch) == flush_size:
+                self._flush_batch(segment, batch)
+                flushed += len(batch)
+                batch = []
+        if batch:
+            self._flush_batch(segment, batch)
+            flushed += len(batch)
+
+        os.remove(segment)
+        SubmissionSpoolCheckpoint.objects.filter(segment=os.path.basename(segment)).delete()
+        return flushed
+
+    def flush(self, flush_size: Optional[int] = None) -> int:
+        flush_size = flush_size or settings.QUIZ_PASS_SPOOL_FLUSH_SIZE
+        self.rotate()
+        return sum(self.flush_segment(segment, flush_size) for segment in self.segments())
+
+    def lag(self) -> Dict:
+        """Отставание записи в базу: объем и возраст самой старой незаписанной записи"""
+        pending_bytes = 0
+        oldest_ts = None
+        paths = self.segments()
+        if os.path.exists(self.current_path):
+            paths.append(self.current_path)
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            offset = self._get_offset(path) if path != self.current_path else 0
+            pending_bytes += size - offset
+            if oldest_ts is None and size > offset:
+                for record, _ in self._read_records(path, offset):
+                    if record is not None:
+                        oldest_ts = record['ts']
+                        break
+        return {
+            'pending_segments': len(paths),
+            'pending_bytes': pending_bytes,
+            'lag_seconds': round(time.time() - oldest_ts, 3) if oldest_ts is not None else 0,
+        }
@@ -1,3 +1,858 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User as AdminUser
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.test import APITestCase
+
+from . import routers
+from .benchmark import QuizBenchmarkDataset, QuizSerializationBenchmark
+from .cache import QuizDefinitionCache
+from .importers import QuizImportController
+from .models import Answer, ArchivedAnswers, Question, QuestionItem, Quiz, User
+from .renderers import FastJSONRenderer
+from .routers import ReplicaRouter, is_pinned, replica_reads
+from .serializers import QuizListValuesSerializer, QuizRetreiveSerializer
+from .services import (
+    AnswerBulkCreateController, QuestionUpdateController, QuizAnswerArchiveController, QuizAnswersExportController,
+    UserController
+)
+from .spool import SubmissionSpool
+from .throttling import LoadShedder, TokenBucketThrottle
+from .views import QuizPassView
+
+Budget = namedtuple('Budget', ['queries', 'db_ms', 'wall_ms'])
+
+# Бюджеты endpoint'ов: максимум SQL запросов (без SAVEPOINT), времени в базе и общего времени запроса
+BUDGETS = {
+    'QuizPassView': Budget(queries=7, db_ms=200, wall_ms=1500),
+    'QuizPassBatchView': Budget(queries=7, db_ms=400, wall_ms=3000),
+    'QuizUserResultView': Budget(queries=4, db_ms=200, wall_ms=1500),
+    'QuizUserResultView.history': Budget(queries=7, db_ms=200, wall_ms=1500),
+    'QuizRetrieveView': Budget(queries=3, db_ms=200, wall_ms=1500),
+    'QuizRetrieveView.not_modified': Budget(queries=1, db_ms=50, wall_ms=500),
+    'QuizQuestionUpdateRemoveView.not_modified': Budget(queries=1, db_ms=50, wall_ms=500),
+    'QuizQuestionUpdateRemoveView': Budget(queries=2, db_ms=100, wall_ms=1000),
+    'QuizStatisticView': Budget(queries=4, db_ms=200, wall_ms=1000),
+    'QuizTreeCreateView': Budget(queries=3, db_ms=300, wall_ms=2000),
+    'QuizCrosstabView': Budget(queries=4, db_ms=300, wall_ms=2000),
+    'QuizCreateUpdateRemoveView.destroy': Budget(queries=20, db_ms=300, wall_ms=2000),
+    'QuestionUpdateController.remove_items': Budget(queries=12, db_ms=200, wall_ms=1000),
+}
+
+
+class QueryBudget:
+    """Замер количества SQL запросов, времени в базе и общего времени выполнения блока"""
+
+    def __init__(self):
+        self.capture = CaptureQueriesContext(connection)
+        self.wall_ms = 0.0
+
+    def __enter__(self):
+        self.capture.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_ms = (time.perf_counter() - self.started) * 1000
+        self.capture.__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def captured_queries(self):
+        return [
+            query for query in self.capture.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+        ]
+
+    @property
+    def queries(self) -> int:
+        return len(self.captured_queries)
+
+    @property
+    def db_ms(self) -> float:
+        return sum(float(query['time']) for query in self.captured_queries) * 1000
+
+
+class BudgetTestCase(APITestCase):
+    """Базовый класс тестов с проверкой бюджетов запросов endpoint'ов"""
+
+    def measure(self, request):
+        with QueryBudget() as budget:
+            response = request()
+        self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+        return budget
+
+    def assertWithinBudget(self, view: str, request) -> QueryBudget:
+        budget = self.measure(request)
+        limit = BUDGETS[view]
+        sql = '\n'.join(query['sql'][:200] for query in budget.captured_queries)
+        self.assertLessEqual(budget.queries, limit.queries, f'{view} SQL queries over budget:\n{sql}')
+        self.assertLessEqual(budget.db_ms, limit.db_ms, f'{view} DB time over budget')
+        self.assertLessEqual(budget.wall_ms, limit.wall_ms, f'{view} wall time over budget')
+        return budget
+
+    def assertQueriesConstant(self, view: str, small_request, large_request) -> None:
+        """Количество запросов не должно зависеть от объема данных"""
+        small = self.measure(small_request)
+        large = self.measure(large_request)
+        self.assertEqual(small.queries, large.queries, f'{view} SQL queries grow with data size')
+
+
+class QuizApiBudgetTest(BudgetTestCase):
+    """Бюджеты SQL запросов и времени ответа API опросов на наборе данных заданного масштаба"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = QuizBenchmarkDataset('small', seed=1)
+        cls.small.seed(quizzes=2, questions=3, items=2, users=2, passes=1)
+        cls.large = QuizBenchmarkDataset('large', seed=1)
+        cls.large.seed(quizzes=12, questions=30, items=6, users=5, passes=12)
+        cls.admin = AdminUser.objects.create(username='admin', is_staff=True, is_superuser=True)
+
+    def post_pass(self, dataset, user):
+        return self.client.post(
+            '/api/v1/quizzes/pass/', dataset.submission(user, dataset.quiz_ids[0]), format='json'
+        )
+
+    def test_quiz_pass(self):
+        self.assertWithinBudget('QuizPassView', lambda: self.post_pass(self.large, 'new-user'))
+        self.assertQueriesConstant(
+            'QuizPassView', lambda: self.post_pass(self.small, 'small-new'), lambda: self.post_pass(self.large, 'large-new')
+        )
+
+    def invalid_submission(self, dataset, user, error):
+        """Прохождение первого опроса набора, в котором ошибочен ответ на последний подходящий вопрос"""
+        submission = dataset.submission(user, dataset.quiz_ids[0])
+        questions = {question[0]: question for question in dataset.questions}
+        question_type = {
+            'error_question_answer_items_not_belong_to_question': 'answer_some_selected',
+            'error_question_answer_items_length_is_more_one': 'answer_one_selected',
+            'error_question_answer_text_is_empty': 'answer_text',
+        }.get(error)
+        answer = next(
+            answer for answer in reversed(submission['questions'])
+            if question_type is None or questions[answer['question']][2] == question_type
+        )
+        if error == 'error_question_is_not_exist':
+            answer['question'] = 10 ** 9
+        elif error == 'error_question_answer_items_not_belong_to_question':
+            answer['answer_selected'] = [next(
+                item for question_pk, _, _, items in dataset.questions if question_pk != answer['question']
+                for item in items
+            )]
+        elif error == 'error_question_answer_items_length_is_more_one':
+            answer['answer_selected'] = questions[answer['question']][3][:2]
+        else:
+            answer['text'] = None
+        return submission
+
+    def test_quiz_pass_rejected(self):
+        for error in [
+            'error_question_answer_items_not_belong_to_question', 'error_question_is_not_exist',
+            'error_question_answer_items_length_is_more_one', 'error_question_answer_text_is_empty',
+        ]:
+            response = self.client.post(
+                '/api/v1/quizzes/pass/', self.invalid_submission(self.large, 'rejected', error), format='json'
+            )
+            self.assertEqual(response.status_code, 400, error)
+            self.assertIn(error, response.data, error)
+        self.assertFalse(Answer.objects.filter(user__name='rejected').exists())
+
+        # проверка всех ответов стоит постоянного числа запросов
+        error = 'error_question_answer_items_not_belong_to_question'
+        budgets = []
+        for dataset in (self.small, self.large):
+            submission = self.invalid_submission(dataset, 'rejected', error)
+            with QueryBudget() as budget:
+                response = self.client.post('/api/v1/quizzes/pass/', submission, format='json')
+            self.assertEqual(response.status_code, 400)
+            budgets.append(budget.queries)
+        self.assertEqual(budgets[0], budgets[1], 'Pass validation SQL queries grow with the number of answers')
+
+    def post_pass_batch(self, dataset, user):
+        submissions = [dataset.submission(f'{user}-{number}', dataset.quiz_ids[0]) for number in range(10)]
+        return self.client.post('/api/v1/quizzes/pass/batch/', {'submissions': submissions}, format='json')
+
+    def test_quiz_pass_batch(self):
+        self.assertWithinBudget('QuizPassBatchView', lambda: self.post_pass_batch(self.large, 'batch'))
+        self.assertQueriesConstant(
+            'QuizPassBatchView',
+            lambda: self.post_pass_batch(self.small, 'small-batch'),
+            lambda: self.post_pass_batch(self.large, 'large-batch'),
+        )
+
+    def test_user_results(self):
+        self.assertWithinBudget(
+            'QuizUserResultView', lambda: self.client.get(f'/api/v1/quizzes/users/{self.large.users[0]}/')
+        )
+        self.assertQueriesConstant(
+            'QuizUserResultView',
+            lambda: self.client.get(f'/api/v1/quizzes/users/{self.small.users[0]}/'),
+            lambda: self.client.get(f'/api/v1/quizzes/users/{self.large.users[0]}/'),
+        )
+
+    def test_active_quizzes(self):
+        self.assertWithinBudget('QuizRetrieveView', lambda: self.client.get('/api/v1/quizzes/all/'))
+
+        queryset = Quiz.objects.order_by('pk')
+        expected = QuizRetreiveSerializer(queryset.prefetch_related('questions'), many=True).data
+        for quiz in expected:
+            quiz['questions'].sort(key=lambda question: question['id'])
+        self.assertEqual(QuizListValuesSerializer.data(QuizListValuesSerializer.values(queryset)), expected)
+        self.assertNotIn('external_id', expected[0]['questions'][0])
+
+    def test_active_quizzes_as_of(self):
+        start = timezone.now() + timedelta(days=3650)
+        finish = start + timedelta(days=1)
+        quiz = Quiz.objects.create(name='as_of', start_date=start, finish_date=finish, description='as_of')
+        for moment, active in [
+            (start - timedelta(seconds=1), False), (start, True), (finish, True), (finish + timedelta(seconds=1), False)
+        ]:
+            response = self.client.get('/api/v1/quizzes/all/', {'as_of': moment.isoformat()})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(quiz.pk in [row['pk'] for row in response.data['results']], active, moment)
+        self.assertEqual(self.client.get('/api/v1/quizzes/all/', {'as_of': 'tomorrow'}).status_code, 400)
+
+    def test_load_shedding(self):
+        url = f'/api/v1/quizzes/users/{self.large.users[0]}/'
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'quiz_user_result': '2/m'}
+        cache.clear()
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+
+        cache.clear()
+        with override_settings(QUIZ_SHED_MAX_CONCURRENCY=0), self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.QUIZ_SHED_RETRY_AFTER))
+
+        latency_key = 'shed:quiz_user_result:db_latency'
+        slow = settings.QUIZ_SHED_DB_LATENCY_MS + 1
+        cache.set(latency_key, (slow, settings.QUIZ_SHED_MIN_SAMPLES))
+        with override_settings(QUIZ_SHED_PROBE_RATE=0):
+            self.assertEqual(self.client.get(url).status_code, 503)
+        # пробные запросы проходят и обновляют задержку
+        with override_settings(QUIZ_SHED_PROBE_RATE=1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(cache.get(latency_key)[1], settings.QUIZ_SHED_MIN_SAMPLES + 1)
+        self.assertLess(cache.get(latency_key)[0], slow)
+        cache.delete(latency_key)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_load_shedding_slow_request(self):
+        url = f'/api/v1/quizzes/users/{self.large.users[0]}/'
+        cache.clear()
+
+        release = LoadShedder.release
+
+        def slow_release(shedder, timer):
+            timer.db_ms = timer.queries * settings.QUIZ_SHED_DB_LATENCY_MS * 2
+            return release(shedder, timer)
+
+        with mock.patch.object(LoadShedder, 'release', slow_release):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertGreater(cache.get('shed:quiz_user_result:db_latency')[0], settings.QUIZ_SHED_DB_LATENCY_MS)
+        # один медленный запрос не закрывает endpoint для остальных клиентов
+        with override_settings(QUIZ_SHED_PROBE_RATE=0):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_token_bucket_concurrency(self):
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'quiz_pass': '5/m'}
+        request = RequestFactory().post('/api/v1/quizzes/pass/', REMOTE_ADDR='10.0.0.1')
+        request.user = None
+        backend = type(caches['default'])
+        cache_get = backend.get
+
+        def slow_get(self, *args, **kwargs):
+            # задержка между чтением и записью корзины открывает окно для гонки одновременных запросов
+            value = cache_get(self, *args, **kwargs)
+            time.sleep(0.002)
+            return value
+
+        cache.clear()
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}), \
+                mock.patch.object(backend, 'get', slow_get), ThreadPoolExecutor(max_workers=20) as executor:
+            allowed = list(executor.map(
+                lambda _: TokenBucketThrottle().allow_request(request, QuizPassView()), range(20)
+            ))
+        self.assertEqual(sum(allowed), 5)
+
+    def test_replica_routing(self):
+        router = ReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica_0']):
+            routers._replica_lag['replica_0'] = (time.monotonic(), 0)
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Quiz), 'replica_0')
+                self.assertEqual(router.db_for_write(Quiz), 'default')
+            self.assertIsNone(router.db_for_read(Quiz))
+            self.assertFalse(router.allow_migrate('replica_0', 'quiz'))
+
+            routers._replica_lag['replica_0'] = (time.monotonic(), settings.DATABASE_REPLICA_MAX_LAG + 1)
+            with replica_reads():
+                self.assertIsNone(router.db_for_read(Quiz))
+
+            request = RequestFactory().get('/api/v1/quizzes/all/')
+            cache.clear()
+            self.assertFalse(is_pinned(request))
+            self.post_pass(self.large, 'pinned-user')
+            self.assertTrue(is_pinned(request))
+        routers._replica_lag.clear()
+
+    def test_openapi_schema(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(OPENAPI_SCHEMA_PATH=f'{directory}/openapi.json'):
+            self.assertEqual(self.client.get('/openapi/?format=openapi').status_code, 404)
+            call_command('generate_openapi_schema', stdout=io.StringIO())
+
+            with mock.patch.object(OpenAPISchemaGenerator, 'get_schema', side_effect=AssertionError), \
+                    self.assertNumQueries(0):
+                response = self.client.get('/openapi/?format=openapi')
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('/quizzes/all/', json.loads(response.content)['paths'])
+
+                response = self.client.get('/openapi/?format=openapi', HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                response = self.client.get(
+                    '/openapi/?format=openapi', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+                for accept_encoding, compressed in (
+                    ('gzip;q=0', False), ('br, gzip;q=0.000', False), ('*;q=0', False), ('*, gzip;q=0', False),
+                    ('deflate, GZIP;Q=0.5', True), ('identity;q=0.5, *', True), ('gzip;q=abc', False),
+                ):
+                    with self.subTest(accept_encoding=accept_encoding):
+                        response = self.client.get('/openapi/?format=openapi', HTTP_ACCEPT_ENCODING=accept_encoding)
+                        self.assertEqual(response.has_header('Content-Encoding'), compressed)
+                        self.assertEqual(response.content[:2] == b'\x1f\x8b', compressed)
+                self.assertEqual(self.client.get('/openapi/').status_code, 200)
+
+    def test_question(self):
+        self.client.force_authenticate(self.admin)
+        small_question = self.small.questions[-1][0]
+        large_question = self.large.questions[-1][0]
+        # первый запрос заполняет кэш дерева опроса
+        self.client.get(f'/api/v1/quizzes/questions/{small_question}/')
+        self.client.get(f'/api/v1/quizzes/questions/{large_question}/')
+        self.assertWithinBudget(
+            'QuizQuestionUpdateRemoveView', lambda: self.client.get(f'/api/v1/quizzes/questions/{large_question}/')
+        )
+        self.assertQueriesConstant(
+            'QuizQuestionUpdateRemoveView',
+            lambda: self.client.get(f'/api/v1/quizzes/questions/{small_question}/'),
+            lambda: self.client.get(f'/api/v1/quizzes/questions/{large_question}/'),
+        )
+        self.assertNotIn('external_id', self.client.get(f'/api/v1/quizzes/questions/{large_question}/').data)
+
+    def test_question_item_update(self):
+        self.client.force_authenticate(self.admin)
+        question_pk, _, question_type, items = next(question for question in self.large.questions if question[3])
+        url = f'/api/v1/quizzes/questions/{question_pk}/'
+        through = Answer.answer_selected.through
+        names = dict(QuestionItem.objects.filter(pk__in=items).values_list('pk', 'name'))
+        selected = {item: through.objects.filter(questionitem_id=item).count() for item in items[:3]}
+
+        for question_item in [[{'name': 'new'}], [{}], [{'pk': 'first'}], [['new']], [{'pk': 10 ** 9}]]:
+            response = self.client.put(url, {'type': question_type, 'question_item': question_item}, format='json')
+            self.assertEqual(response.status_code, 400, question_item)
+
+        response = self.client.put(url, {'type': question_type, 'question_item': [
+            {'pk': str(items[0])}, {'pk': items[1], 'name': 'renamed'}, names[items[2]], 'new'
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        remaining = dict(QuestionItem.objects.filter(question_id=question_pk).values_list('pk', 'name'))
+        new_pk = next(pk for pk, name in remaining.items() if name == 'new')
+        self.assertEqual(remaining, {items[0]: names[items[0]], items[1]: 'renamed', items[2]: names[items[2]], new_pk: 'new'})
+        self.assertEqual({item: through.objects.filter(questionitem_id=item).count() for item in items[:3]}, selected)
+        self.assertFalse(through.objects.filter(questionitem_id__in=items[3:]).exists())
+
+    def test_conditional_get(self):
+        self.client.force_authenticate(self.admin)
+        question = self.large.questions[0]
+        for view, url in [
+            ('QuizRetrieveView', '/api/v1/quizzes/all/'),
+            ('QuizQuestionUpdateRemoveView', f'/api/v1/quizzes/questions/{question[0]}/'),
+        ]:
+            etag = self.client.get(url)['ETag']
+            self.assertWithinBudget(
+                f'{view}.not_modified', lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            )
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('Cache-Control', response)
+
+            QuizDefinitionCache.bump_version(question[1])
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+        # наборы с одинаковыми количеством, максимумом и суммой pk
+        first, second, third, fourth, fifth = self.large.quiz_ids[:5]
+        self.assertEqual(first + fourth, second + third)
+        self.assertNotEqual(
+            QuizDefinitionCache.list_etag(Quiz.objects.filter(pk__in=[first, fourth, fifth])),
+            QuizDefinitionCache.list_etag(Quiz.objects.filter(pk__in=[second, third, fifth])),
+        )
+
+        # опрос выходит из выборки активных со временем, без изменения версии
+        etag = self.client.get('/api/v1/quizzes/all/')['ETag']
+        Quiz.objects.filter(pk=self.large.quiz_ids[-1]).update(finish_date=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.client.get('/api/v1/quizzes/all/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_definition_invalidation(self):
+        question_pk, quiz_id, _, items = next(question for question in self.small.questions if question[3])
+        # изменение вопроса через ORM, как из админки, без вызовов сервисов API
+        with mock.patch('quiz.cache.transaction.on_commit', lambda callback: callback()):
+            version = QuizDefinitionCache.get_version(quiz_id)
+            question = Question.objects.get(pk=question_pk)
+            question.text = 'renamed'
+            question.save()
+            self.assertNotEqual(QuizDefinitionCache.get_version(quiz_id), version)
+            self.assertEqual(QuizDefinitionCache.get_question(quiz_id, question_pk)['text'], 'renamed')
+
+            version = QuizDefinitionCache.get_version(quiz_id)
+            self.client.force_authenticate(self.admin)
+            self.client.delete(f'/api/v1/quizzes/questions/question_item/{items[0]}/')
+            self.assertNotEqual(QuizDefinitionCache.get_version(quiz_id), version)
+            self.assertNotIn(
+                items[0], [item['pk'] for item in QuizDefinitionCache.get_question(quiz_id, question_pk)['question_item']]
+            )
+
+    def test_quiz_delete(self):
+        self.client.force_authenticate(self.admin)
+        quiz_id = self.large.quiz_ids[0]
+        question = Question.objects.filter(quiz_id=quiz_id).exclude(type='answer_text').first()
+        QuestionItem.objects.bulk_create([
+            QuestionItem(question=question, name=f'extra-{number}') for number in range(100)
+        ])
+        # удаление идет пачками по 100 строк, запросов на каждый вариант ответа нет
+        self.assertWithinBudget(
+            'QuizCreateUpdateRemoveView.destroy', lambda: self.client.delete(f'/api/v1/quizzes/{quiz_id}/')
+        )
+        self.assertFalse(QuestionItem.objects.filter(question=question).exists())
+
+    def test_question_item_remove(self):
+        def remove_items(dataset, extra_items):
+            question = Question.objects.get(pk=next(question[0] for question in dataset.questions if question[3]))
+            QuestionItem.objects.bulk_create([
+                QuestionItem(question=question, name=f'extra-{number}') for number in range(extra_items)
+            ])
+            keep = QuestionItem.objects.filter(question=question).order_by('pk').values_list('pk', flat=True).first()
+            with QueryBudget() as budget:
+                QuestionUpdateController({'question_item': [{'pk': keep}]}, question).update()
+            self.assertEqual(list(QuestionItem.objects.filter(question=question).values_list('pk', flat=True)), [keep])
+            return budget
+
+        small = remove_items(self.small, 0)
+        large = remove_items(self.large, 50)
+        limit = BUDGETS['QuestionUpdateController.remove_items']
+        sql = '\n'.join(query['sql'][:200] for query in large.captured_queries)
+        self.assertLessEqual(large.queries, limit.queries, f'Question item removal SQL queries over budget:\n{sql}')
+        self.assertLessEqual(large.db_ms, limit.db_ms)
+        self.assertEqual(small.queries, large.queries, 'Question item removal SQL queries grow with data size')
+
+    def test_fast_json(self):
+        for payload in QuizSerializationBenchmark(self.large).payloads().values():
+            self.assertEqual(json.loads(FastJSONRenderer().render(payload)), payload)
+        moment = timezone.now()
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render({'moment': moment})),
+            {'moment': timezone.localtime(moment).strftime('%d-%m-%YT%H:%M:%S%z')}
+        )
+        response = self.client.post('/api/v1/quizzes/pass/', '{"user": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_quiz_statistics(self):
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget(
+            'QuizStatisticView', lambda: self.client.get(f'/api/v1/quizzes/{self.large.quiz_ids[0]}/stats/')
+        )
+        self.assertQueriesConstant(
+            'QuizStatisticView',
+            lambda: self.client.get(f'/api/v1/quizzes/{self.small.quiz_ids[0]}/stats/'),
+            lambda: self.client.get(f'/api/v1/quizzes/{self.large.quiz_ids[0]}/stats/'),
+        )
+
+        quiz_id = self.large.quiz_ids[0]
+        self.assertEqual(self.post_pass(self.large, 'statistics-user').status_code, 200)
+        stats_url = f'/api/v1/quizzes/{quiz_id}/stats/'
+        counters = self.client.get(stats_url).data
+        through = Answer.answer_selected.through
+        answers_count = {question['pk']: question['answers_count'] for question in counters['questions']}
+        selected_count = {
+            item['pk']: item['selected_count'] for question in counters['questions'] for item in question['question_item']
+        }
+        self.assertEqual(answers_count, {
+            question_pk: Answer.objects.filter(question_id=question_pk).count() for question_pk in answers_count
+        })
+        self.assertEqual(selected_count, {
+            item_pk: through.objects.filter(questionitem_id=item_pk).count() for item_pk in selected_count
+        })
+        self.assertTrue(any(answers_count.values()) and any(selected_count.values()))
+
+        call_command('rebuild_quiz_statistics', quiz=quiz_id, stdout=io.StringIO())
+        self.assertEqual(self.client.get(stats_url).data, counters)
+
+    def post_quiz_tree(self, questions):
+        now = timezone.now()
+        return self.client.post('/api/v1/quizzes/tree/', {
+            'name': f'tree-{questions}',
+            'start_date': now.isoformat(),
+            'finish_date': (now + timedelta(days=1)).isoformat(),
+            'description': 'tree',
+            'questions': [{
+                'text': f'question-{number}',
+                'type': 'answer_some_selected',
+                'question_item': [f'item-{item}' for item in range(5)]
+            } for number in range(questions)]
+        }, format='json')
+
+    def test_quiz_tree_create(self):
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget('QuizTreeCreateView', lambda: self.post_quiz_tree(100))
+        self.assertQueriesConstant(
+            'QuizTreeCreateView', lambda: self.post_quiz_tree(1), lambda: self.post_quiz_tree(100)
+        )
+
+    def import_quizzes(self, questions, **options):
+        definition = {
+            'key': f'import-{questions}',
+            'name': 'import',
+            'start_date': '2026-01-01T00:00:00Z',
+            'finish_date': '2027-01-01T00:00:00Z',
+            'description': 'import',
+            'questions': [{
+                'key': f'question-{number}',
+                'text': f'question-{number}',
+                'type': 'answer_one_selected',
+                'question_item': ['yes', 'no']
+            } for number in range(questions)]
+        }
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as definition_file:
+            json.dump([definition], definition_file)
+            definition_file.flush()
+            with QueryBudget() as budget:
+                report = QuizImportController(**options).run([definition_file.name])
+        return budget, report
+
+    def test_quiz_import(self):
+        small, _ = self.import_quizzes(1)
+        large, report = self.import_quizzes(100)
+        self.assertEqual(small.queries, large.queries, 'Quiz import SQL queries grow with data size')
+        self.assertEqual(report['questions_created'], 100)
+        _, report = self.import_quizzes(100, dry_run=True)
+        self.assertEqual(report['questions_unchanged'], 100)
+        self.assertEqual(report['question_items_created'], 0)
+
+    @override_settings(QUIZ_ANSWER_SELECTED_STORAGE='inline')
+    def test_inline_answer_selected(self):
+        self.assertWithinBudget('QuizPassView', lambda: self.post_pass(self.large, 'inline-user'))
+        self.post_pass(self.small, 'inline-small')
+        self.assertFalse(Answer.answer_selected.through.objects.filter(answer__user__name='inline-user').exists())
+        self.assertQueriesConstant(
+            'QuizUserResultView',
+            lambda: self.client.get('/api/v1/quizzes/users/inline-small/'),
+            lambda: self.client.get('/api/v1/quizzes/users/inline-user/'),
+        )
+
+        response = self.client.get('/api/v1/quizzes/users/inline-user/')
+        answers = [question['answers'] for question in response.data['results_quizzes'][0]['quiz']['questions']]
+        exported = {
+            row['id']: row['answer_selected'] for row in QuizAnswersExportController(self.large.quiz_ids[0]).rows()
+        }
+        self.assertTrue(any(answer['answer_selected'] for answer in answers))
+        for answer in answers:
+            self.assertEqual(exported[answer['id']], answer['answer_selected'])
+
+    def expected_export(self, quiz_id):
+        """Строки выгрузки, собранные по Answer и таблице связей"""
+        selected = {}
+        for answer_pk, name in Answer.answer_selected.through.objects.filter(
+            answer__question__quiz_id=quiz_id
+        ).order_by('pk').values_list('answer_id', 'questionitem__name'):
+            selected.setdefault(answer_pk, []).append(name)
+        answers = Answer.objects.filter(question__quiz_id=quiz_id).select_related('user', 'question').order_by('pk')
+        return [{
+            'id': answer.pk,
+            'user': answer.user.name,
+            'question': answer.question_id,
+            'question_text': answer.question.text,
+            'text': answer.text,
+            'answer_selected': selected.get(answer.pk, []),
+        } for answer in answers]
+
+    @staticmethod
+    def parse_csv(content: str):
+        rows = list(csv.DictReader(io.StringIO(content, newline='')))
+        for row in rows:
+            row['id'], row['question'] = int(row['id']), int(row['question'])
+            row['text'] = row['text'] or None
+            row['answer_selected'] = row['answer_selected'].split(';') if row['answer_selected'] else []
+        return rows
+
+    def test_export_answers(self):
+        self.client.force_authenticate(self.admin)
+        quiz_id = self.large.quiz_ids[0]
+        expected = self.expected_export(quiz_id)
+        chunk_size = 7
+        self.assertGreater(len(expected), 2 * chunk_size)
+
+        with override_settings(QUIZ_EXPORT_CHUNK_SIZE=chunk_size):
+            response = self.client.get(f'/api/v1/quizzes/{quiz_id}/answers/export/')
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            self.assertEqual(response['Content-Disposition'], f'attachment; filename="quiz_{quiz_id}_answers.ndjson"')
+            content = b''.join(response.streaming_content).decode()
+            self.assertEqual([json.loads(line) for line in content.splitlines()], expected)
+
+            response = self.client.get(f'/api/v1/quizzes/{quiz_id}/answers/export/', {'output': 'csv'})
+            self.assertEqual(response['Content-Type'], 'text/csv')
+            self.assertEqual(response['Content-Disposition'], f'attachment; filename="quiz_{quiz_id}_answers.csv"')
+            self.assertEqual(self.parse_csv(b''.join(response.streaming_content).decode()), expected)
+
+        self.assertEqual(
+            self.client.get(f'/api/v1/quizzes/{quiz_id}/answers/export/', {'output': 'xml'}).status_code, 400
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'answers.csv')
+            call_command('export_quiz_answers', quiz_id, format='csv', output=path, chunk_size=chunk_size)
+            with open(path, encoding='utf-8', newline='') as export_file:
+                self.assertEqual(self.parse_csv(export_file.read()), expected)
+        stdout = io.StringIO()
+        call_command('export_quiz_answers', quiz_id, chunk_size=chunk_size, stdout=stdout)
+        self.assertEqual([json.loads(line) for line in stdout.getvalue().splitlines()], expected)
+
+    def selected_storage_snapshot(self):
+        """Результаты пользователя, выгрузка и пересчитанная статистика опроса при текущем способе хранения"""
+        quiz_id = self.large.quiz_ids[0]
+        self.client.force_authenticate(self.admin)
+        call_command('rebuild_quiz_statistics', quiz=quiz_id, stdout=io.StringIO())
+        return {
+            'results': self.client.get(f'/api/v1/quizzes/users/{self.large.users[0]}/').data,
+            'export': list(QuizAnswersExportController(quiz_id).rows()),
+            'statistics': self.client.get(f'/api/v1/quizzes/{quiz_id}/stats/').data,
+        }
+
+    @staticmethod
+    def through_items():
+        selected = {}
+        for answer_pk, item_pk in Answer.answer_selected.through.objects.order_by('pk').values_list(
+            'answer_id', 'questionitem_id'
+        ):
+            selected.setdefault(answer_pk, []).append(item_pk)
+        return selected
+
+    def test_migrate_answer_selected(self):
+        selected = self.through_items()
+        expected = self.selected_storage_snapshot()
+        self.assertTrue(selected)
+        for keep_source in (False, True):
+            with self.subTest(keep_source=keep_source):
+                call_command(
+                    'migrate_answer_selected', to='inline', batch_size=7, keep_source=keep_source, stdout=io.StringIO()
+                )
+                inline = dict(Answer.objects.filter(selected_items__isnull=False).values_list('pk', 'selected_items'))
+                self.assertEqual(inline, selected)
+                self.assertEqual(self.through_items(), selected if keep_source else {})
+                with override_settings(QUIZ_ANSWER_SELECTED_STORAGE='inline'):
+                    self.assertEqual(self.selected_storage_snapshot(), expected)
+
+                call_command(
+                    'migrate_answer_selected', to='m2m', batch_size=7, keep_source=keep_source, stdout=io.StringIO()
+                )
+                self.assertEqual(self.through_items(), selected)
+                self.assertEqual(Answer.objects.filter(selected_items__isnull=False).exists(), keep_source)
+                self.assertEqual(self.selected_storage_snapshot(), expected)
+                Answer.objects.update(selected_items=None)
+
+    def get_crosstab(self, dataset):
+        question_a, question_b = [
+            question_pk for question_pk, quiz_id, question_type, _ in dataset.questions
+            if quiz_id == dataset.quiz_ids[0] and question_type != 'answer_text'
+        ][:2]
+        return self.client.get(
+            f'/api/v1/quizzes/{dataset.quiz_ids[0]}/crosstab/', {'question_a': question_a, 'question_b': question_b}
+        )
+
+    def test_quiz_crosstab(self):
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget('QuizCrosstabView', lambda: self.get_crosstab(self.large))
+        # первый запрос заполняет кэш дерева опроса
+        self.get_crosstab(self.small)
+        self.assertQueriesConstant(
+            'QuizCrosstabView', lambda: self.get_crosstab(self.small), lambda: self.get_crosstab(self.large)
+        )
+
+        crosstab = self.get_crosstab(self.large).data
+        question_a, question_b = crosstab['question_a'], crosstab['question_b']
+        selected = {}
+        rows = Answer.answer_selected.through.objects.filter(
+            answer__question_id__in=[question_a['pk'], question_b['pk']]
+        ).values_list('answer__user_id', 'answer__question_id', 'questionitem_id')
+        for user_pk, question_pk, item_pk in rows:
+            selected.setdefault(user_pk, {}).setdefault(question_pk, set()).add(item_pk)
+        for row, item_a in zip(crosstab['matrix'], question_a['question_item']):
+            for count, item_b in zip(row, question_b['question_item']):
+                expected = sum(
+                    1 for questions in selected.values()
+                    if item_a['pk'] in questions.get(question_a['pk'], ()) and item_b['pk'] in questions.get(question_b['pk'], ())
+                )
+                self.assertEqual(count, expected)
+
+    def test_archive_quiz_answers(self):
+        user_url = f'/api/v1/quizzes/users/{self.large.users[0]}/'
+        before = self.client.get(user_url).data
+        controller = QuizAnswerArchiveController(chunk_size=2)
+        for quiz_id in self.large.quiz_ids:
+            controller.archive(quiz_id)
+        self.assertFalse(Answer.objects.filter(question__quiz_id__in=self.large.quiz_ids).exists())
+
+        self.assertEqual(self.client.get(user_url).data['results_quizzes'], [])
+        self.assertWithinBudget('QuizUserResultView.history', lambda: self.client.get(user_url, {'history': True}))
+        self.assertEqual(self.client.get(user_url, {'history': True}).data, before)
+
+        for quiz_id in self.large.quiz_ids:
+            controller.restore(quiz_id)
+        self.assertEqual(self.client.get(user_url).data, before)
+
+    def test_archive_answer_added_during_transfer(self):
+        question_pk, quiz_id, _, _ = self.large.questions[0]
+        user = Answer.objects.filter(question__quiz_id=quiz_id).values_list('user_id', flat=True).first()
+        controller = QuizAnswerArchiveController(chunk_size=10 ** 6)
+        late = []
+
+        def add_answer(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # ответ пользователя из переносимого диапазона появляется между записью архива и удалением
+            if sql.startswith(f'INSERT INTO {controller.archive_table}') and not late:
+                late.append(Answer.objects.create(user_id=user, question_id=question_pk, text='late').pk)
+            return result
+
+        with connection.execute_wrapper(add_answer):
+            controller.archive(quiz_id)
+        self.assertEqual(list(Answer.objects.filter(question__quiz_id=quiz_id).values_list('pk', flat=True)), late)
+        controller.archive(quiz_id)
+        archived = ArchivedAnswers.objects.get(quiz_id=quiz_id, user_id=user).answers
+        self.assertIn(late[0], [answer[0] for answer in archived])
+
+
+class SubmissionSpoolTest(TestCase):
+    """Журнал прохождений: дозапись, ротация, продолжение после падения и dead-letter файл"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = QuizBenchmarkDataset('spool', seed=1)
+        cls.dataset.seed(quizzes=1, questions=3, items=2, users=1, passes=0)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = SubmissionSpool(directory.name)
+
+    def submissions(self, *users):
+        return [self.dataset.submission(user, self.dataset.quiz_ids[0]) for user in users]
+
+    def passed_users(self):
+        return set(Answer.objects.filter(user__name__startswith='spool-pass-').values_list('user__name', flat=True))
+
+    def test_append_rotate(self):
+        self.assertIsNone(self.spool.rotate())
+        self.spool.append(self.submissions('spool-pass-1', 'spool-pass-2'))
+        self.spool.append(self.submissions('spool-pass-3'))
+        segment = self.spool.rotate()
+        self.assertEqual(self.spool.segments(), [segment])
+        self.assertFalse(os.path.exists(self.spool.current_path))
+        self.assertEqual(self.spool.lag()['pending_segments'], 1)
+
+        self.assertEqual(self.spool.flush(), 3)
+        self.assertEqual(self.passed_users(), {'spool-pass-1', 'spool-pass-2', 'spool-pass-3'})
+        self.assertEqual(self.spool.segments(), [])
+
+    def test_replay_from_checkpoint(self):
+        self.spool.append(self.submissions(*(f'spool-pass-{number}' for number in range(5))))
+        write_batch = SubmissionSpool._write_batch
+        batches = []
+
+        def crash_on_second_batch(spool, segment, records, offset):
+            batches.append(records)
+            if len(batches) == 2:
+                raise OperationalError('connection lost')
+            return write_batch(spool, segment, records, offset)
+
+        with mock.patch.object(SubmissionSpool, '_write_batch', crash_on_second_batch):
+            with self.assertRaises(OperationalError):
+                self.spool.flush(flush_size=2)
+        self.assertEqual(self.passed_users(), {'spool-pass-0', 'spool-pass-1'})
+
+        self.assertEqual(self.spool.flush(flush_size=2), 3)
+        self.assertEqual(self.passed_users(), {f'spool-pass-{number}' for number in range(5)})
+        # пачка, записанная до падения, не записывается повторно
+        questions = Question.objects.filter(quiz_id=self.dataset.quiz_ids[0]).count()
+        self.assertEqual(Answer.objects.filter(user__name='spool-pass-0').count(), questions)
+
+    def test_dead_letter(self):
+        self.spool.append(self.submissions('spool-pass-1', 'x' * 300, 'spool-pass-2'))
+        with self.assertLogs('quiz.spool', 'ERROR'):
+            self.assertEqual(self.spool.flush(), 3)
+        self.assertEqual(self.passed_users(), {'spool-pass-1', 'spool-pass-2'})
+        with open(self.spool.dead_letter_path, encoding='utf-8') as dead_letter_file:
+            entries = [json.loads(line) for line in dead_letter_file]
+        self.assertEqual([entry['record']['user'] for entry in entries], ['x' * 300])
+        self.assertEqual(self.spool.segments(), [])
+
+
+class UserCacheTest(TransactionTestCase):
+    """Кэш pk пользователей заполняется после фиксации транзакции, поэтому проверяется с настоящими транзакциями"""
+
+    def setUp(self):
+        self.dataset = QuizBenchmarkDataset('users', seed=1)
+        self.dataset.seed(quizzes=1, questions=2, items=2, users=0, passes=0)
+        UserController.cache.clear()
+        self.addCleanup(UserController.cache.clear)
+
+    def submit(self, user):
+        return AnswerBulkCreateController([self.dataset.submission(user, self.dataset.quiz_ids[0])]).create()
+
+    def test_cache_hit(self):
+        self.submit('alice')
+        with self.assertNumQueries(0):
+            users = UserController.get_or_create_pks({'alice'})
+        self.assertEqual(users, {'alice': User.objects.get(name='alice').pk})
+
+    def test_deleted_user(self):
+        self.submit('alice')
+        stale_pk = UserController.cache.get('alice')
+        User.objects.filter(name='alice').delete()
+        self.assertIsNone(UserController.cache.get('alice'))
+
+        # другой процесс удаление не видел, в его кэше остался pk удаленного пользователя
+        UserController.cache.set('alice', stale_pk)
+        answers = self.submit('alice')
+        user = User.objects.get(name='alice')
+        self.assertNotEqual(user.pk, stale_pk)
+        self.assertEqual({answer.user_id for answer in answers}, {user.pk})
+        self.assertEqual(UserController.cache.get('alice'), user.pk)
+
+        UserController.cache.set('alice', stale_pk)
+        with transaction.atomic():
+            answers = self.submit('alice')
+        self.assertEqual(Answer.objects.filter(user=user).count(), 2 * len(answers))
@@ -0,0 +1,179 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from .errors import ERRORS
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Ограничение частоты запросов клиента по алгоритму token bucket.
+
+    Скорость задается в DEFAULT_THROTTLE_RATES для throttle_scope представления: при 20/s в корзине
+    клиента до 20 токенов, которые восполняются со скоростью 20 в секунду. Клиент определяется
+    по пользователю или по IP. Состояние корзин хранится в общем кэше Django и видно всем процессам,
+    корзина читается и обновляется под блокировкой клиента на cache.add, поэтому одновременные
+    запросы клиента не расходуют один и тот же токен.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    # время ожидания блокировки корзины, секунды; блокировка упавшего процесса истекает через LOCK_TIMEOUT
+    LOCK_WAIT = 0.05
+    LOCK_TIMEOUT = 1
+
+    def __init__(self):
+        self.wait_seconds = None
+        super().__init__()
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        key = self.cache_format % {'scope': self.scope, 'ident': ident}
+        if not self._lock(f'{key}:lock'):
+            self.wait_seconds = self.duration / self.num_requests
+            return False
+        try:
+            now = self.timer()
+            tokens, updated = cache.get(key, (self.num_requests, now))
+            tokens = min(self.num_requests, tokens + (now - updated) * self.num_requests / self.duration)
+            if tokens < 1:
+                self.wait_seconds = (1 - tokens) * self.duration / self.num_requests
+                return False
+            cache.set(key, (tokens - 1, now), self.duration)
+            return True
+        finally:
+            cache.delete(f'{key}:lock')
+
+    def _lock(self, lock_key: str) -> bool:
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not cache.add(lock_key, 1, timeout=self.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ERRORS['error_service_overloaded']
+    default_code = 'service_overloaded'
+
+    def __init__(self, wait: int):
+        super().__init__()
+        # обработчик исключений DRF выставляет по wait заголовок Retry-After
+        self.wait = wait
+
+
+class QueryTimer:
+    """Обертка execute_wrapper с подсчетом запросов и времени в базе"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+
+class LoadShedder:
+    """
+    Сброс нагрузки endpoint'а по числу запросов в обработке и средней задержке запроса к базе.
+
+    Оба показателя общие для всех процессов и хранятся в кэше Django, ключи живут QUIZ_SHED_WINDOW секунд
+    после последнего обновления. Задержка - сглаженное среднее вместе с числом замеров: по задержке запросы
+    отклоняются только после QUIZ_SHED_MIN_SAMPLES замеров, так что один медленный запрос не закрывает endpoint.
+    Пока запросы отклоняются, доля QUIZ_SHED_PROBE_RATE пропускается и продолжает обновлять задержку.
+    """
+    scope: str
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.inflight_key = f'shed:{scope}:inflight'
+        self.latency_key = f'shed:{scope}:db_latency'
+
+    def acquire(self) -> None:
+        latency, samples = cache.get(self.latency_key, (None, 0))
+        if (
+            samples >= settings.QUIZ_SHED_MIN_SAMPLES and latency > settings.QUIZ_SHED_DB_LATENCY_MS
+            and random.random() >= settings.QUIZ_SHED_PROBE_RATE
+        ):
+            raise ServiceOverloaded(settings.QUIZ_SHED_RETRY_AFTER)
+
+        cache.add(self.inflight_key, 0, timeout=settings.QUIZ_SHED_WINDOW)
+        try:
+            inflight = cache.incr(self.inflight_key)
+        except ValueError:
+            cache.add(self.inflight_key, 1, timeout=settings.QUIZ_SHED_WINDOW)
+            inflight = 1
+        cache.touch(self.inflight_key, settings.QUIZ_SHED_WINDOW)
+        if inflight > settings.QUIZ_SHED_MAX_CONCURRENCY:
+            self._decr()
+            raise ServiceOverloaded(settings.QUIZ_SHED_RETRY_AFTER)
+
+    def _decr(self) -> None:
+        try:
+            cache.decr(self.inflight_key)
+        except ValueError:
+            pass
+
+    def release(self, timer: QueryTimer) -> None:
+        self._decr()
+        if not timer.queries:
+            return
+        sample = timer.db_ms / timer.queries
+        latency, samples = cache.get(self.latency_key, (None, 0))
+        if latency is not None:
+            sample = latency + (sample - latency) * settings.QUIZ_SHED_LATENCY_SMOOTHING
+        cache.set(self.latency_key, (sample, samples + 1), timeout=settings.QUIZ_SHED_WINDOW)
+
+
+class LoadSheddingMixin:
+    """
+    Ограничение частоты запросов клиента (429) и сброс нагрузки endpoint'а (503) с заголовком Retry-After.
+
+    Проверки выполняются после аутентификации, до разбора тела запроса и обращения к данным.
+    """
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope: str
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        shedder = LoadShedder(self.throttle_scope)
+        shedder.acquire()
+        self.load_shedder = shedder
+
+    def dispatch(self, request, *args, **kwargs):
+        self.load_shedder = None
+        timer = QueryTimer()
+        try:
+            with ExitStack() as stack:
+                # запросы считаются во всех базах, чтение может идти с реплики
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.load_shedder is not None:
+                self.load_shedder.release(timer)
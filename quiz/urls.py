@@ -3,26 +3,38 @@ from django.urls import path
 from .views import (
     QuizRetrieveView,
     QuizCreateUpdateRemoveView,
+    QuizTreeCreateView,
     QuizQuestionUpdateRemoveView,
     QuizQuestionCreateView,
     QuestionItemnUpdateRemoveView,
     QuizPassView,
-    QuizUserResultView
+    QuizPassBatchView,
+    QuizPassSpoolLagView,
+    QuizUserResultView,
+    QuizAnswersExportView,
+    QuizStatisticView,
+    QuizCrosstabView
 )
 
 urlpatterns = [
     path('quizzes/', QuizCreateUpdateRemoveView.as_view({
         'post': 'create',
     })),
+    path('quizzes/tree/', QuizTreeCreateView.as_view()),
     path('quizzes/all/', QuizRetrieveView.as_view({
         'get': 'list',
     })),
     path('quizzes/pass/', QuizPassView.as_view()),
+    path('quizzes/pass/batch/', QuizPassBatchView.as_view()),
+    path('quizzes/pass/spool/', QuizPassSpoolLagView.as_view()),
     path('quizzes/<int:pk>/', QuizCreateUpdateRemoveView.as_view({
         'put': 'update',
         'patch': 'partial_update',
         'delete': 'destroy'
     })),
+    path('quizzes/<int:quiz>/stats/', QuizStatisticView.as_view()),
+    path('quizzes/<int:quiz>/crosstab/', QuizCrosstabView.as_view()),
+    path('quizzes/<int:quiz>/answers/export/', QuizAnswersExportView.as_view()),
     path('quizzes/<int:quiz>/questions/', QuizQuestionCreateView.as_view()),
     path('quizzes/questions/<int:question>/', QuizQuestionUpdateRemoveView.as_view()),
     path('quizzes/questions/question_item/<int:question_item>/', QuestionItemnUpdateRemoveView.as_view()),
@@ -1,24 +1,62 @@
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAdminUser, AllowAny
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
-from drf_yasg.openapi import Response as ResponceYASG
+from drf_yasg.openapi import Response as ResponceYASG, Parameter, IN_QUERY, TYPE_STRING, TYPE_INTEGER, TYPE_BOOLEAN
 from drf_yasg.utils import swagger_auto_schema
 
 from .models import Quiz, Question, QuestionItem
+from .pagination import KeysetPagination
+from .spool import SubmissionSpool
+from .routers import ReplicaReadMixin
+from .throttling import LoadSheddingMixin
 from .serializers import (
     QuizSerializer,
     QuizRetreiveSerializer,
+    QuizListValuesSerializer,
+    QuizActiveFilterSerializer,
+    QuizCrosstabSerializer,
+    QuizUserResultFilterSerializer,
+    QuizTreeCreateSerializer,
     QuestionCreateSerializer,
     QuestionUpdateSerializer,
     QuestionSerializer,
     QuestionItemSerializer,
     QuizPassSerializer,
+    QuizPassBatchSerializer,
     QuizUserResultSerializer
 )
-from .services import prepare_question_data_to_output
+from .cache import QuizDefinitionCache
+from .errors import ERRORS
+from .services import (
+    prepare_question_data_to_output,
+    check_quiz_is_exist,
+    QuizAnswersExportController,
+    QuizStatisticController,
+    QuizCrosstabController
+)
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET по ETag: при совпадении If-None-Match ответ 304 отдается до загрузки
+    и сериализации данных, ответы 200 и 304 получают ETag и заголовки Cache-Control.
+    """
+    cache_control = {}
+
+    def conditional_get(self, request, etag: str, build_response):
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = build_response()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_cache_control(response, **self.cache_control)
+        return response
 
 
 class QuizCreateUpdateRemoveView(ModelViewSet):
@@ -52,17 +90,55 @@ class QuizCreateUpdateRemoveView(ModelViewSet):
         return super(QuizCreateUpdateRemoveView, self).destroy(request, *args, **kwargs)
 
 
-class QuizRetrieveView(ModelViewSet):
+class QuizTreeCreateView(APIView):
+    """Добавление опроса вместе с вопросами и вариантами ответа одним запросом"""
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=QuizTreeCreateSerializer,
+        responses={201: QuizTreeCreateSerializer},
+        operation_description='Create quiz with questions and question items',
+    )
+    def post(self, request):
+        serializer = QuizTreeCreateSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class QuizRetrieveView(ReplicaReadMixin, ConditionalGetMixin, ModelViewSet):
     """Получение списка активных опросов"""
-    queryset = Quiz.objects.all().prefetch_related('questions')
+    queryset = Quiz.objects.all()
     serializer_class = QuizRetreiveSerializer
     permission_classes = [AllowAny]
+    cache_control = {
+        'public': True,
+        'max_age': settings.QUIZ_HTTP_CACHE_MAX_AGE,
+        's_maxage': settings.QUIZ_HTTP_CACHE_SHARED_MAX_AGE,
+    }
+
+    def get_queryset(self):
+        filter_serializer = QuizActiveFilterSerializer(data=self.request.query_params)
+        filter_serializer.is_valid(raise_exception=True)
+        as_of = filter_serializer.validated_data.get('as_of', timezone.now())
+        return super(QuizRetrieveView, self).get_queryset().filter(
+            finish_date__gte=as_of, start_date__lte=as_of
+        ).order_by('pk')
 
     @swagger_auto_schema(
-        operation_description='Retrieve all quizzes',
+        query_serializer=QuizActiveFilterSerializer,
+        operation_description='Retrieve quizzes active now or at as_of datetime',
     )
     def list(self, request, *args, **kwargs):
-        super(QuizRetrieveView, self).list( request, *args, **kwargs)
+        queryset = self.get_queryset()
+
+        def build_response():
+            page = self.paginate_queryset(QuizListValuesSerializer.values(queryset))
+            return self.get_paginated_response(QuizListValuesSerializer.data(page))
+
+        etag = QuizDefinitionCache.list_etag(queryset)
+        return self.conditional_get(request, etag, build_response)
 
 
 class QuizQuestionCreateView(APIView):
@@ -84,10 +160,12 @@ class QuizQuestionCreateView(APIView):
             return Response(serializer.errors)
 
 
-class QuizQuestionUpdateRemoveView(APIView):
+class QuizQuestionUpdateRemoveView(ReplicaReadMixin, ConditionalGetMixin, APIView):
     """Изменение, удаление вопросов"""
     permission_classes = [IsAdminUser]
     serializer_class = QuestionUpdateSerializer
+    # ответ доступен только администраторам: в общих кэшах не хранится, браузер проверяет его по ETag
+    cache_control = {'private': True, 'no_cache': True}
 
     @staticmethod
     def get_object(pk):
@@ -127,10 +205,15 @@ class QuizQuestionUpdateRemoveView(APIView):
     )
     def get(self, request, question: int):
         instance = self.get_object(question)
-        serializer = QuestionSerializer(instance)
-        data = serializer.data.copy()
-        del data['id']
-        return Response(prepare_question_data_to_output(instance, data))
+
+        def build_response():
+            serializer = QuestionSerializer(instance)
+            data = serializer.data.copy()
+            del data['id']
+            return Response(prepare_question_data_to_output(instance, data))
+
+        etag = QuizDefinitionCache.question_etag(instance.quiz_id, instance.pk)
+        return self.conditional_get(request, etag, build_response)
 
 
 class QuestionItemnUpdateRemoveView(APIView):
@@ -141,7 +224,7 @@ class QuestionItemnUpdateRemoveView(APIView):
     @staticmethod
     def get_object(pk):
         try:
-            return QuestionItem.objects.get(pk=pk)
+            return QuestionItem.objects.select_related('question').get(pk=pk)
         except QuestionItem.DoesNotExist:
             raise Http404
 
@@ -153,6 +236,7 @@ class QuestionItemnUpdateRemoveView(APIView):
         """Удаление"""
         instance = self.get_object(question_item)
         instance.delete()
+        QuizDefinitionCache.invalidate(instance.question.quiz_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @swagger_auto_schema(
@@ -164,13 +248,15 @@ class QuestionItemnUpdateRemoveView(APIView):
         serializer = QuestionItemSerializer(instance, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            QuizDefinitionCache.invalidate(instance.question.quiz_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QuizPassView(APIView):
+class QuizPassView(LoadSheddingMixin, APIView):
     """Прохождение опроса"""
     permission_classes = [AllowAny]
+    throttle_scope = 'quiz_pass'
 
     @swagger_auto_schema(
         request_body=QuizPassSerializer,
@@ -179,26 +265,146 @@ class QuizPassView(APIView):
     def post(self, request):
         serializer = QuizPassSerializer(data=request.data)
         if serializer.is_valid():
+            if settings.QUIZ_PASS_SPOOL_ENABLED:
+                SubmissionSpool().append([serializer.validated_data])
+                return Response(request.data, status=status.HTTP_202_ACCEPTED)
             serializer.save()
             return Response(request.data)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QuizUserResultView(APIView):
+class QuizPassBatchView(LoadSheddingMixin, APIView):
+    """Пакетное прохождение опросов"""
+    permission_classes = [AllowAny]
+    throttle_scope = 'quiz_pass'
+
+    @swagger_auto_schema(
+        request_body=QuizPassBatchSerializer,
+        operation_description='Quiz pass batch',
+    )
+    def post(self, request):
+        serializer = QuizPassBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            if settings.QUIZ_PASS_SPOOL_ENABLED:
+                SubmissionSpool().append(serializer.validated_data['submissions'])
+                return Response({
+                    'submissions': len(serializer.validated_data['submissions'])
+                }, status=status.HTTP_202_ACCEPTED)
+            answers = serializer.save()
+            return Response({
+                'submissions': len(serializer.validated_data['submissions']),
+                'answers': len(answers)
+            }, status=status.HTTP_201_CREATED)
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class QuizPassSpoolLagView(APIView):
+    """Отставание отложенной записи прохождений опросов"""
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description='Retrieve lag of quiz pass spool',
+    )
+    def get(self, request):
+        return Response(SubmissionSpool().lag())
+
+
+class QuizUserResultView(ReplicaReadMixin, LoadSheddingMixin, APIView):
     """Получение детализации пройденных пользователем опросов"""
     permission_classes = [AllowAny]
+    throttle_scope = 'quiz_user_result'
     serializer_class = QuizUserResultSerializer
+    pagination_class = KeysetPagination
 
     @swagger_auto_schema(
+        manual_parameters=[
+            Parameter('cursor', IN_QUERY, type=TYPE_STRING, description='The pagination cursor value.'),
+            Parameter('history', IN_QUERY, type=TYPE_BOOLEAN, description='Include archived quizzes.'),
+        ],
         responses={
             200: ResponceYASG('test', QuizUserResultSerializer)
         },
         operation_description='Retrieve detail information of user passed quizzes',
     )
     def get(self, request, user: str):
-        serializer = QuizUserResultSerializer(data={'user': user})
+        filter_serializer = QuizUserResultFilterSerializer(data=request.query_params)
+        filter_serializer.is_valid(raise_exception=True)
+        paginator = self.pagination_class()
+        serializer = QuizUserResultSerializer(data={'user': user}, context={
+            'request': request,
+            'paginator': paginator,
+            'include_history': filter_serializer.validated_data['history'],
+        })
         if serializer.is_valid():
-            return Response(serializer.data)
+            return Response({
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+                **serializer.data
+            })
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class QuizAnswersExportView(APIView):
+    """Потоковая выгрузка всех ответов опроса в NDJSON или CSV"""
+    permission_classes = [IsAdminUser]
+    EXPORT_CONTENT_TYPES = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            Parameter('output', IN_QUERY, type=TYPE_STRING, enum=['ndjson', 'csv'], default='ndjson'),
+        ],
+        operation_description='Export all answers of quiz',
+    )
+    def get(self, request, quiz: int):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.EXPORT_CONTENT_TYPES:
+            return Response(ERRORS['error_export_format_is_not_exist'], status=status.HTTP_400_BAD_REQUEST)
+        if not check_quiz_is_exist(quiz):
+            raise Http404
+
+        export = QuizAnswersExportController(quiz)
+        rows = export.to_csv() if output == 'csv' else export.to_ndjson()
+        response = StreamingHttpResponse(rows, content_type=self.EXPORT_CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="quiz_{quiz}_answers.{output}"'
+        return response
+
+
+class QuizStatisticView(APIView):
+    """Статистика ответов на вопросы опроса"""
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description='Retrieve statistics of answers to quiz questions',
+    )
+    def get(self, request, quiz: int):
+        quiz = Quiz.objects.filter(pk=quiz).values('id', 'name').first()
+        if quiz is None:
+            raise Http404
+        return Response(QuizStatisticController.statistics(quiz))
+
+
+class QuizCrosstabView(APIView):
+    """Таблица сопряженности выборов вариантов ответа двух вопросов опроса"""
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            Parameter('question_a', IN_QUERY, type=TYPE_INTEGER, required=True),
+            Parameter('question_b', IN_QUERY, type=TYPE_INTEGER, required=True),
+        ],
+        operation_description='Cross-tabulate selected question items of two quiz questions',
+    )
+    def get(self, request, quiz: int):
+        if QuizDefinitionCache.get(quiz) is None:
+            raise Http404
+        serializer = QuizCrosstabSerializer(data=request.query_params, context={'quiz': quiz})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        crosstab_controller = QuizCrosstabController(quiz, **serializer.validated_data)
+        return Response(crosstab_controller.compute())